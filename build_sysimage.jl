@@ -0,0 +1,23 @@
+using Pkg
+
+# Build a Julia system image with HllSets and PyCall compiled in.
+# Point HLLSETS_SYSIMAGE at the result to skip JIT on meta_algebra startup:
+#
+#   julia build_sysimage.jl [output_path]
+
+# Set the project directory
+project_dir = joinpath(@__DIR__, "sgs_core", "HllSets")
+sysimage_path = length(ARGS) > 0 ? ARGS[1] : joinpath(project_dir, "dist", "hllsets_sysimage.so")
+
+Pkg.add(["PackageCompiler", "PyCall"])
+Pkg.develop(path=project_dir)
+
+using PackageCompiler
+
+mkpath(dirname(sysimage_path))
+create_sysimage(
+    [:HllSets, :PyCall];
+    sysimage_path=sysimage_path,
+    precompile_execution_file=joinpath(project_dir, "precompile.jl")
+)
+println("System image built at: ", sysimage_path)
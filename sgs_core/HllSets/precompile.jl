@@ -0,0 +1,15 @@
+# Workload executed by PackageCompiler while building the system image
+# (see build_sysimage.jl), so the hot HllSets methods are compiled ahead of time.
+
+using HllSets
+
+for P in (10,)
+    a = HllSet(P)
+    b = HllSet(P)
+    add!(a, "warm-up")
+    add!(a, ["warm", "up"])
+    add!(b, ["up"])
+    count(union(a, b))
+    count(intersect(a, b))
+    id(a)
+end
@@ -54,12 +54,27 @@ module HllSets
             (P < 4 || P > 18) && throw(ArgumentError("P must be between 4 and 18"))
             new(fill(UInt32(0), 2^P))
         end
+
+        function HllSet{P}(counts::Vector{UInt32}) where {P}
+            isa(P, Integer) || throw(ArgumentError("P must be integer"))
+            (P < 4 || P > 18) && throw(ArgumentError("P must be between 4 and 18"))
+            length(counts) == 2^P || throw(ArgumentError("counts must hold 2^P registers"))
+            new(counts)
+        end
     end
 
     function HllSet(p::Int=10)
         return HllSet{p}()
     end
 
+    """
+        HllSet(counts::Vector{UInt32})
+    Create an HLL set that adopts a register vector of length 2^P, without copying it.
+    """
+    function HllSet(counts::Vector{UInt32})
+        return HllSet{trailing_zeros(length(counts))}(counts)
+    end
+
     # Core HLL Operations --------------------------------------------------------
 
     """
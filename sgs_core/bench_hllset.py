@@ -0,0 +1,82 @@
+# bench_hllset.py
+#
+# Ingest throughput of HllSet construction, in tokens/sec.
+#
+#   HLLSETS_BACKEND=julia python bench_hllset.py --tokens 1000000
+#
+# "per-element" is the old path (one add call per token), "batch" hands the
+# whole token list over at once, "stream" feeds it in chunks and "parallel"
+# shards the chunks across --workers processes (HllSet.from_iterable).
+
+import argparse
+import os
+import time
+
+from meta_algebra import HllSet, hllsets_backend
+
+
+def _rate(n_tokens, seconds):
+    return n_tokens / seconds if seconds > 0 else float("inf")
+
+
+def bench_per_element(tokens, P):
+    hll = HllSet(P)
+    start = time.perf_counter()
+    for token in tokens:
+        hll.add(token)
+    return hll, time.perf_counter() - start
+
+
+def bench_batch(tokens, P):
+    hll = HllSet(P)
+    start = time.perf_counter()
+    hll.add_batch(tokens)
+    return hll, time.perf_counter() - start
+
+
+def bench_stream(tokens, P, chunk_size):
+    hll = HllSet(P)
+    start = time.perf_counter()
+    hll.add_stream(iter(tokens), chunk_size=chunk_size)
+    return hll, time.perf_counter() - start
+
+
+def bench_parallel(tokens, P, chunk_size, workers):
+    # Start the worker pool (and its interpreters) outside the measurement
+    HllSet.from_iterable(tokens[:workers], P, workers=workers, chunk_size=1)
+    start = time.perf_counter()
+    hll = HllSet.from_iterable(iter(tokens), P, workers=workers, chunk_size=chunk_size)
+    return hll, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HllSet ingest benchmark")
+    parser.add_argument("--tokens", type=int, default=1_000_000)
+    parser.add_argument("--P", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    tokens = [f"token-{i}" for i in range(args.tokens)]
+
+    # Warm up compiled paths so the first measurement isn't JIT time
+    bench_batch(tokens[:1000], args.P)
+
+    print(f"backend={hllsets_backend} tokens={args.tokens} P={args.P}")
+    results = {}
+    for name, run in (
+        ("per-element", lambda: bench_per_element(tokens, args.P)),
+        ("batch", lambda: bench_batch(tokens, args.P)),
+        ("stream", lambda: bench_stream(tokens, args.P, args.chunk_size)),
+        ("parallel", lambda: bench_parallel(tokens, args.P, args.chunk_size, args.workers)),
+    ):
+        hll, seconds = run()
+        results[name] = hll
+        print(f"{name:>12}: {_rate(args.tokens, seconds):>14,.0f} tokens/sec ({seconds:.3f}s, count={hll.count()})")
+
+    if not (results["per-element"] == results["batch"] == results["stream"] == results["parallel"]):
+        print("WARNING: registers differ between ingest paths")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,108 @@
+import contextlib
+import json
+import os
+import yaml
 from starlette.applications import Starlette
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, StreamingResponse
 from starlette.routing import Route
 import uvicorn
-from u_controller import Controller
+import meta_algebra
+from u_controller import Controller, YamlLoader, msgpack_loads
+from u_executor import Executor, Overloaded
+
+# The Universal Controller lives for the whole process so resolved
+# processors and their store instances are reused across requests
+controller = Controller()
+
+# Runs blocking processors off the event loop, see u_executor
+executor = Executor.from_env(controller)
+
+# Default and maximum concurrency of one /process/batch request
+BATCH_PARALLELISM = int(os.getenv("SGS_BATCH_PARALLELISM", "8"))
+BATCH_PARALLELISM_MAX = int(os.getenv("SGS_BATCH_PARALLELISM_MAX", "64"))
 
 # Define the request handler
 async def handle_request(request):
-    # Initialize the Universal Controller
-    controller = Controller()
-    # Parse the YAML request
-    yaml_request = await request.body()
-    print(yaml_request)
+    # Parse the request body (YAML, JSON or msgpack)
+    body = await request.body()
+    print(body)
 
     try:
-        yaml_request = yaml_request.decode("utf-8")
+        parsed = controller.parse_request(body, request.headers.get("content-type", ""))
         # Process the request
-        result = controller.process_request(yaml_request)    
+        result = await executor.run(parsed)
         # Return the result as JSON
         return JSONResponse(result)
+    except Overloaded as e:
+        return JSONResponse(
+            {"status": "error", "message": str(e)},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         return JSONResponse({"status": "error", "message": str(e)})
 
+def parse_batch(body: bytes, content_type: str) -> list:
+    """
+    Split a batch body into single request dictionaries: a JSON or
+    msgpack array, or a multi-document YAML stream.
+    """
+    content_type = content_type.lower()
+    if "msgpack" in content_type:
+        documents = msgpack_loads(body)
+    elif "json" in content_type or body.lstrip().startswith(b"["):
+        documents = json.loads(body)
+    else:
+        documents = [doc for doc in yaml.load_all(body, Loader=YamlLoader) if doc is not None]
+    if not isinstance(documents, list):
+        raise ValueError("Batch must be an array of requests")
+    return documents
+
+async def handle_batch(request):
+    """
+    Run a batch of /process requests concurrently and stream NDJSON lines
+    {"index": i, "result": ...} in completion order.
+    """
+    body = await request.body()
+    try:
+        requests = parse_batch(body, request.headers.get("content-type", ""))
+        parallelism = int(request.query_params.get("parallelism", BATCH_PARALLELISM))
+        parallelism = max(1, min(parallelism, BATCH_PARALLELISM_MAX))
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+    async def lines():
+        async for index, result in executor.run_batch(requests, parallelism):
+            try:
+                line = json.dumps({"index": index, "result": result})
+            except (TypeError, ValueError) as e:
+                line = json.dumps({"index": index, "result": {"status": "error", "message": str(e)}})
+            yield line + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 # Define a simple route
 async def homepage(request):
     return JSONResponse({"message": "Hello, SGS.core!"})
 
 # Define the routes
 routes = [
-    Route("/", homepage), Route("/process", handle_request, methods=["POST"])
+    Route("/", homepage), Route("/process", handle_request, methods=["POST"]),
+    Route("/process/batch", handle_batch, methods=["POST"])
 ]
 
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Pay Julia startup and JIT before accepting requests when asked to
+    if os.getenv("HLLSETS_WARMUP"):
+        meta_algebra.warm_up(int(os.getenv("HLLSETS_WARMUP_P", "10")))
+    yield
+    executor.shutdown()
+
 # Create the Starlette app
 # app = Starlette(routes=routes)
 # Create the Starlette app
-app = Starlette(routes=routes)
+app = Starlette(routes=routes, lifespan=lifespan)
 
 # Run the server
 if __name__ == "__main__":
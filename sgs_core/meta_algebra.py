@@ -1,101 +1,438 @@
 # meta_algebra.py
 
-from julia import Main
+import collections
+import concurrent.futures
+import hashlib
+import importlib.util
+import itertools
+import multiprocessing
 import os
+import re
+import struct
+import sys
+import threading
+
+import mmh3
+import numpy as np
+
+# Select the HllSet engine: "julia" (HllSets.jl through PyJulia) or "numpy"
+# (pure NumPy/mmh3, no Julia runtime required). The engines hash tokens
+# differently, so the same tokens give different registers and ids on
+# each: switching backends changes every stored b:/rbs: key.
+hllsets_backend = os.getenv("HLLSETS_BACKEND", "julia").lower()
+
+if hllsets_backend not in ("julia", "numpy"):
+    raise EnvironmentError(f"Unknown HLLSETS_BACKEND '{hllsets_backend}', expected 'julia' or 'numpy'")
 
 # Get the path from the environment variable
 hllsets_path = os.getenv("HLLSETS_PATH")
 
-if not hllsets_path:
-    raise EnvironmentError("HLLSETS_PATH environment variable is not set")
+# Content hashes of HllSet.id(): "sha1" (the hash in b:/rbs: keys, and the
+# default) or "xxh3" (128-bit XXH3 from the optional xxhash package, an
+# order of magnitude faster). Keys internal to the process, such as the
+# result cache's, use XXH3 whenever xxhash is installed
+ID_HASHES = ("sha1", "xxh3")
+
+# Optional prebuilt Julia system image with HllSets (and PyCall) baked in,
+# see build_sysimage.jl
+hllsets_sysimage = os.getenv("HLLSETS_SYSIMAGE")
+
+_julia_main = None
+_julia_lock = threading.Lock()
+
+
+# Julia engine ------------------------------------------------------------
+# ==============================================================================
+
+def julia_main():
+    """
+    Return Julia's Main module with HllSets loaded.
+
+    The Julia runtime is started on first use rather than at import, so
+    importing meta_algebra (and every module that imports it) stays cheap.
+    """
+    global _julia_main
+    if _julia_main is None:
+        with _julia_lock:
+            if _julia_main is None:
+                _julia_main = _load_julia()
+    return _julia_main
+
+
+def _load_julia():
+    """Start Julia and bring HllSets into Main."""
+    if hllsets_sysimage:
+        from julia.api import Julia
+        Julia(sysimage=hllsets_sysimage)
+        from julia import Main
+
+        # HllSets is compiled into the image as a package
+        Main.eval("using HllSets")
+        return Main
+
+    if not hllsets_path:
+        raise EnvironmentError("HLLSETS_PATH environment variable is not set")
+
+    from julia import Main
+
+    # Load the HllSets.jl file
+    Main.include(hllsets_path)
+
+    Main.using(".HllSets")
+    return Main
+
+
+def warm_up(P=10):
+    """
+    Load the engine and run the hot HllSets methods once so their JIT
+    compilation happens now instead of on the first request.
+
+    Julia specializes on HllSet{P}, so warm up with the precision in use.
+    No-op for the NumPy backend.
+    """
+    if hllsets_backend != "julia":
+        return
+    a = JuliaHllSet(P)
+    b = JuliaHllSet(P)
+    a.add("warm-up")
+    a.add_batch(["warm", "up"])
+    b.add_batch(["up"])
+    a.union(b).count()
+    a.intersection(b).id()
+
+
+def _precision_of(counts):
+    """Precision P of a register array, which must hold exactly 2^P registers."""
+    P = counts.size.bit_length() - 1
+    if counts.ndim != 1 or counts.size != 1 << P or not 4 <= P <= 18:
+        raise ValueError("Register array must hold 2^P registers with P between 4 and 18")
+    return P
+
+
+def content_hash(data, hash_name="sha1"):
+    """
+    Hex digest of a register buffer with one of ID_HASHES.
+
+    Args:
+        data: bytes or a C-contiguous little-endian uint32 array.
+        hash_name: Hash to use.
+    """
+    if hash_name == "sha1":
+        return hashlib.sha1(data).hexdigest()
+    if hash_name == "xxh3":
+        try:
+            import xxhash
+        except ImportError:
+            raise EnvironmentError("The xxh3 id hash requires the 'xxhash' package")
+        return xxhash.xxh3_128_hexdigest(data)
+    raise ValueError(f"Unknown id hash '{hash_name}', expected one of {ID_HASHES}")
+
+
+def _token_list(elements):
+    """
+    Materialize a batch of tokens as a list of str that PyJulia can hand
+    to Julia as a single Vector{String}.
+
+    NumPy string arrays are unpacked with tolist() and bytes are decoded as
+    UTF-8 so a token hashes the same whichever container it arrives in.
+    """
+    if isinstance(elements, np.ndarray):
+        elements = elements.tolist()
+    return [e.decode("utf-8") if isinstance(e, bytes) else e for e in elements]
+
+
+def _chunks(elements, chunk_size):
+    """Yield consecutive lists of at most chunk_size items from an iterable."""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    iterator = iter(elements)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Memoization -------------------------------------------------------------
+# ==============================================================================
+
+# Byte budget of the process-wide result cache; 0 disables it
+HLLSETS_CACHE_BYTES = int(os.getenv("HLLSETS_CACHE_BYTES", str(64 << 20)))
+
+# Nominal size of a cached count
+_COUNT_ENTRY_BYTES = 64
+
+# Hash of cache keys, which never leave the process
+_CACHE_HASH = "xxh3" if importlib.util.find_spec("xxhash") else "sha1"
+
+
+class HllCache:
+    """
+    Byte-bounded LRU of HllSet counts and union/intersection results.
+
+    Keys are built from the backend type and a content hash of each
+    operand (HllSet._cache_id()), so a set mutated by add/add_batch no
+    longer matches its old entries, and a result cached for one backend is
+    never handed to the other.
+    Cached results are handed out copy-on-write: mutating one copies its
+    registers first, so a cached value never changes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        """Cached value for key, or None; counts a hit or a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
 
-# Load the HllSets.jl file
-Main.include(hllsets_path)
+    def put(self, key, value, nbytes):
+        """Cache value, evicting least recently used entries past max_bytes."""
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, size) = self._entries.popitem(last=False)
+                self.nbytes -= size
 
-Main.using(".HllSets")
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = self.hits = self.misses = 0
 
-class HllSet:
+    def stats(self):
+        """Hit/miss counters and current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+hll_cache = HllCache(HLLSETS_CACHE_BYTES)
+
+
+def _cached_count(hll, compute):
+    """Memoize hll's count by its precision and content hash."""
+    if not hll_cache.enabled:
+        return compute()
+    key = ("count", type(hll), hll.P, hll._cache_id())
+    count = hll_cache.get(key)
+    if count is None:
+        count = compute()
+        hll_cache.put(key, count, _COUNT_ENTRY_BYTES)
+    return count
+
+
+def _cached_operation(operation, a, b, compute):
+    """
+    Memoize a commutative binary operation by the operand content hashes.
+    The result and the cached value share registers copy-on-write.
+    """
+    if not hll_cache.enabled:
+        return compute()
+    key = (operation, type(a), a.P, *sorted((a._cache_id(), b._cache_id())))
+    cached = hll_cache.get(key)
+    if cached is not None:
+        return cached._share()
+    result = compute()
+    shared = result._share()
+    hll_cache.put(key, shared, shared._nbytes())
+    return result
+
+
+# Julia HllSet -------------------------------------------------------------
+# ==============================================================================
+
+class JuliaHllSet:
     def __init__(self, P=10):
         """
         Initialize an HllSet with a given precisiona P.
         """
         self.P = P
-        self.hll = Main.HllSet(P)  # Create a new HllSet in Julia
+        self.hll = julia_main().HllSet(P)  # Create a new HllSet in Julia
+        # True while self.hll is shared with the result cache
+        self._shared = False
+        # id() per hash name and _cache_id() under "cache", dropped on mutation
+        self._ids = {}
+
+    def _share(self):
+        """Another handle on the same Julia HllSet, copy-on-write for both."""
+        self._shared = True
+        twin = JuliaHllSet.__new__(JuliaHllSet)
+        twin.P = self.P
+        twin.hll = self.hll
+        twin._shared = True
+        twin._ids = dict(self._ids)
+        return twin
+
+    def _nbytes(self):
+        return 4 << self.P
+
+    def _own(self):
+        """Copy a shared Julia HllSet before it is mutated."""
+        if self._shared:
+            self.hll = getattr(julia_main(), "copy!")(self.hll)
+            self._shared = False
 
     def add(self, element):
         """
         Add an element to the HllSet.
         """
+        self._own()
+        self._ids = {}
         # Use getattr to call the Julia function with '!'
-        add_func = getattr(Main, "add!")
+        add_func = getattr(julia_main(), "add!")
         add_func(self.hll, element)
 
     def add_batch(self, elements):
         """
         Add a batch of elements to the HllSet.
+
+        The whole batch crosses into Julia once and is folded into the
+        registers by add!(hll, values::Vector).
         """
+        tokens = _token_list(elements)
+        if not tokens:
+            return
+        self._own()
+        self._ids = {}
         # Use getattr to call the Julia function with '!'
-        add_func = getattr(Main, "add!")
-        for element in elements:
-            add_func(self.hll, element)
+        add_func = getattr(julia_main(), "add!")
+        add_func(self.hll, tokens)
+
+    def add_stream(self, elements, chunk_size=100_000):
+        """
+        Add an iterable of elements in chunks of chunk_size, so arbitrarily
+        long token streams are marshalled to Julia with bounded memory.
+        """
+        for chunk in _chunks(elements, chunk_size):
+            self.add_batch(chunk)
 
     def count(self):
         """
-        Estimate the cardinality of the HllSet.
+        Estimate the cardinality of the HllSet, memoized in hll_cache.
         """
-        return Main.count(self.hll)
+        return _cached_count(self, lambda: julia_main().count(self.hll))
 
     def union(self, other):
         """
-        Perform a union with another HllSet.
+        Perform a union with another HllSet, memoized in hll_cache.
         """
-        result = Main.union(self.hll, other.hll)
-        return HllSet.from_julia(result)
+        return _cached_operation(
+            "union", self, other,
+            lambda: JuliaHllSet.from_julia(julia_main().union(self.hll, other.hll))
+        )
 
     def intersection(self, other):
         """
-        Perform an intersection with another HllSet.
+        Perform an intersection with another HllSet, memoized in hll_cache.
         """
-        result = Main.intersect(self.hll, other.hll)
-        return HllSet.from_julia(result)
+        return _cached_operation(
+            "intersection", self, other,
+            lambda: JuliaHllSet.from_julia(julia_main().intersect(self.hll, other.hll))
+        )
 
     def difference(self, other):
         """
         Perform a difference with another HllSet.
         Returns three HllSets: deleted, retained, and new.
         """
-        deleted, retained, new = Main.diff(self.hll, other.hll)
+        deleted, retained, new = julia_main().diff(self.hll, other.hll)
         return (
-            HllSet.from_julia(deleted),
-            HllSet.from_julia(retained),
-            HllSet.from_julia(new)
+            JuliaHllSet.from_julia(deleted),
+            JuliaHllSet.from_julia(retained),
+            JuliaHllSet.from_julia(new)
         )
-    
+
     def complement(self, other):
         """
         Perform a complement operation with another HllSet.
         """
-        result = Main.set_comp(self.hll, other.hll)
-        return HllSet.from_julia(result)
-    
-    def id(self):
+        result = julia_main().set_comp(self.hll, other.hll)
+        return JuliaHllSet.from_julia(result)
+
+    def id(self, hash_name="sha1"):
         """
-        Get SHA1 hash of the HllSet counts.
+        Content hash of the HllSet counts, SHA1 unless hash_name says
+        otherwise, cached until the next add/add_batch.
         """
-        return Main.id(self.hll)
+        content_id = self._ids.get(hash_name)
+        if content_id is None:
+            if hash_name == "sha1":
+                content_id = julia_main().id(self.hll)
+            else:
+                content_id = content_hash(self.counts, hash_name)
+            self._ids[hash_name] = content_id
+        return content_id
+
+    def _cache_id(self):
+        """Content hash keying hll_cache entries."""
+        content_id = self._ids.get("cache")
+        if content_id is None:
+            counts = np.ascontiguousarray(self.counts, dtype="<u4")
+            content_id = self._ids["cache"] = content_hash(counts, _CACHE_HASH)
+        return content_id
 
     def __eq__(self, other):
         """Compare two HllSets for equality."""
-        if not isinstance(other, HllSet):
+        if not isinstance(other, JuliaHllSet):
             return False
-        return Main.isequal(self.hll, other.hll)
-        
+        return julia_main().isequal(self.hll, other.hll)
+
     def to_binary_tensor(self):
         """
-        Convert the HllSet to a binary tensor.
+        Convert the HllSet to a boolean NumPy tensor of shape (2^P, 32),
+        most significant bit first, like HllSets.to_binary_tensor but
+        unpacked from the registers instead of built from bitstrings.
+        """
+        return to_binary_tensors(self.counts[np.newaxis], dtype=bool)[0]
+
+    @property
+    def counts(self):
+        """
+        The Julia register vector as a read-only uint32 NumPy array.
+
+        PyCall hands Julia arrays to NumPy without copying, so this is a
+        live view of the registers; copy it to keep a snapshot across adds.
         """
-        return Main.to_binary_tensor(self.hll)
-       
+        counts = np.asarray(self.hll.counts)
+        counts.flags.writeable = False
+        return counts
+
+    @counts.setter
+    def counts(self, counts):
+        """Replace the registers with a uint32 array of the same 2^P length."""
+        counts = np.ascontiguousarray(counts, dtype=np.uint32)
+        if counts.ndim != 1 or counts.size != 1 << self.P:
+            raise ValueError(f"Register array must hold 2^{self.P} registers")
+        self.hll = julia_main().HllSet(counts)
+        self._shared = False
+        self._ids = {}
 
     @classmethod
     def from_dict(cls, redis_data: dict, P: int = 10):
@@ -123,15 +460,1011 @@ class HllSet:
             hll.add(value.decode() if isinstance(value, bytes) else value)
 
         return hll
-    
+
+    @classmethod
+    def from_counts(cls, counts):
+        """
+        Create an HllSet from a register array of length 2^P.
+        """
+        counts = np.ascontiguousarray(counts, dtype=np.uint32)
+        _precision_of(counts)
+        # The buffer crosses into Julia as one Vector{UInt32}, which the
+        # HllSet adopts as its registers
+        return cls.from_julia(julia_main().HllSet(counts))
+
+    @classmethod
+    def from_iterable(cls, tokens, P: int = 10, workers=None, chunk_size: int = 100_000):
+        """
+        Build an HllSet from a (possibly huge) token iterable on several
+        worker processes, see build_registers. workers=1 builds in process.
+        """
+        if workers == 1:
+            hll = cls(P)
+            hll.add_stream(tokens, chunk_size=chunk_size)
+            return hll
+        return cls.from_counts(build_registers(tokens, P, workers, chunk_size, backend="julia"))
+
     @classmethod
     def from_julia(cls, julia_hll):
         """
         Create a Python HllSet from a Julia HllSet.
         """
-        hll = cls()
+        hll = cls.__new__(cls)
+        hll.P = _precision_of(np.asarray(julia_hll.counts))
         hll.hll = julia_hll
+        hll._shared = False
+        hll._ids = {}
+        return hll
+
+    def __repr__(self):
+        return f"HllSet(P={self.P}, count={self.count()})"
+
+
+# NumPy HllSet -------------------------------------------------------------
+# ==============================================================================
+
+def _load_bias_tables():
+    """
+    Read RAW_ARRAYS and BIAS_ARRAYS from HllSets.jl's constants.jl so the
+    NumPy estimator uses exactly the same bias correction as the Julia one.
+
+    Returns:
+        Tuple of (raw_arrays, bias_arrays), lists of float64 arrays indexed by P - 4.
+    """
+    if hllsets_path:
+        constants_path = os.path.join(os.path.dirname(hllsets_path), "constants.jl")
+    else:
+        constants_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "HllSets", "src", "constants.jl")
+
+    with open(constants_path) as f:
+        source = "\n".join(line.split("#", 1)[0] for line in f)
+
+    raw_part, bias_part = source.split("const BIAS_ARRAYS", 1)
+
+    def parse(part):
+        return [
+            np.array([float(v) for v in body.replace("\n", " ").split(",") if v.strip()])
+            for body in re.findall(r"\[([^\[\]]*)\]", part)
+        ]
+
+    return parse(raw_part), parse(bias_part)
+
+
+_RAW_ARRAYS, _BIAS_ARRAYS = _load_bias_tables()
+
+
+def _token_bytes(token):
+    """Normalize a token to the bytes that get hashed."""
+    if isinstance(token, bytes):
+        return token
+    return str(token).encode("utf-8")
+
+
+def hash_tokens(tokens) -> np.ndarray:
+    """
+    Hash tokens with MurmurHash3 into non-negative 63-bit integers.
+
+    Only the range matches HllSets.u_hash (Julia's hash folded into
+    [0, typemax(Int64))); the hash itself differs, so NumPy registers are
+    not interchangeable with Julia registers built from the same tokens.
+
+    Args:
+        tokens: Iterable of str/bytes tokens, or a NumPy string/bytes array.
+
+    Returns:
+        uint64 array of hashes.
+    """
+    hashes = np.fromiter(
+        (mmh3.hash64(_token_bytes(token), signed=False)[0] for token in tokens),
+        dtype=np.uint64
+    )
+    return hashes & np.uint64(0x7FFFFFFFFFFFFFFF)
+
+
+def getbin(hashes: np.ndarray, P: int = 10) -> np.ndarray:
+    """
+    Zero-based register index for each hash (HllSets.getbin minus one).
+    """
+    return (hashes >> np.uint64(63 - P)).astype(np.intp)
+
+
+def getzeros(hashes: np.ndarray, P: int = 10) -> np.ndarray:
+    """
+    One-based trailing-zero position for each hash, same as HllSets.getzeros.
+    """
+    or_mask = np.uint64(((1 << P) - 1) << (64 - P))
+    masked = hashes | or_mask
+    lowest = masked & (~masked + np.uint64(1))
+    return np.log2(lowest.astype(np.float64)).astype(np.int64) + 1
+
+
+def _alpha(P):
+    if P == 4:
+        return 0.673
+    elif P == 5:
+        return 0.697
+    elif P == 6:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / (1 << P))
+
+
+def _bias(P, biased_estimates):
+    """
+    Bias correction for an array of raw estimates, HllSets.bias vectorized.
+    """
+    rawarray = _RAW_ARRAYS[P - 4]
+    biasarray = _BIAS_ARRAYS[P - 4]
+    firstindex = np.searchsorted(rawarray, biased_estimates, side="left")
+    # Linearly approximate the right value for bias; the clipped indices
+    # only matter where neither boundary case below applies
+    hi = np.clip(firstindex, 1, len(rawarray) - 1)
+    x1, x2 = rawarray[hi - 1], rawarray[hi]
+    y1, y2 = biasarray[hi - 1], biasarray[hi]
+    delta = (biased_estimates - x1) / (x2 - x1)
+    bias = y1 + delta * (y2 - y1)
+    # Raw count too small, cannot be corrected
+    bias = np.where(firstindex == 0, biasarray[0], bias)
+    # Raw count large, no need for bias correction
+    return np.where(firstindex == len(rawarray), 0.0, bias)
+
+
+def _estimate(P, inverse_sums):
+    """
+    Cardinality estimates from the sums of 2^-maxidx over each set's
+    registers, as in HllSets.count.
+    """
+    m = 1 << P
+    biased_estimates = _alpha(P) * m * (m / inverse_sums)
+    return np.rint(biased_estimates - _bias(P, biased_estimates)).astype(np.int64)
+
+
+# Register rows estimated per step by count_many, bounding the float64
+# temporaries to COUNT_MANY_BLOCK x 2^P
+COUNT_MANY_BLOCK = 4096
+
+
+def count_many(counts) -> np.ndarray:
+    """
+    Estimate the cardinality of many HllSets at once.
+
+    Args:
+        counts: (N, 2^P) array of stacked register arrays, e.g.
+            np.stack([hll.counts for hll in hllsets]).
+
+    Returns:
+        int64 array of N estimates, equal to HllSet.count() of each row.
+    """
+    counts = np.asarray(counts, dtype=np.uint32)
+    if counts.ndim != 2:
+        raise ValueError("Register matrix must be 2-D, one HllSet per row")
+    P = _precision_of(counts[0] if counts.shape[0] else np.empty(counts.shape[1]))
+    estimates = np.empty(counts.shape[0], dtype=np.int64)
+    for start in range(0, counts.shape[0], COUNT_MANY_BLOCK):
+        block = counts[start:start + COUNT_MANY_BLOCK]
+        # maxidx: position of the highest set bit in each register
+        _, maxidx = np.frexp(block.astype(np.float64))
+        estimates[start:start + block.shape[0]] = _estimate(P, np.ldexp(1.0, -maxidx).sum(axis=1))
+    return estimates
+
+
+# A sparse HllSet promotes itself to the dense register array once more
+# than this fraction of its 2^P registers is non-zero
+SPARSE_MAX_FILL = 0.25
+
+
+def _merge_registers(index, values):
+    """
+    OR together register values that share an index.
+
+    Returns:
+        Tuple of (index, values) with index sorted and unique.
+    """
+    if index.size == 0:
+        return index, values
+    order = np.argsort(index, kind="stable")
+    index = index[order]
+    values = values[order]
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    return index[starts], np.bitwise_or.reduceat(values, starts)
+
+
+class NumpyHllSet:
+    def __init__(self, P=10, sparse=True):
+        """
+        Initialize an HllSet with a given precision P.
+
+        Registers use the HllSets.jl layout: 2^P uint32 bitmaps where bit
+        (zeros - 1) of register bin is set for every added element.
+
+        A new set starts sparse (sorted index/value arrays of the touched
+        registers) unless sparse=False, and promotes itself to the dense
+        array past SPARSE_MAX_FILL.
+        """
+        if not isinstance(P, int):
+            raise ValueError("P must be integer")
+        if P < 4 or P > 18:
+            raise ValueError("P must be between 4 and 18")
+        self.P = P
+        self._counts = None
+        self._index = np.empty(0, dtype=np.uint32)
+        self._values = np.empty(0, dtype=np.uint32)
+        # id() per hash name and _cache_id() under "cache", dropped whenever
+        # the registers change
+        self._ids = {}
+        if not sparse:
+            self._counts = np.zeros(1 << P, dtype=np.uint32)
+
+    def _share(self):
+        """
+        Another handle on the same registers. Both become copy-on-write:
+        the arrays are made read-only and every mutation path replaces
+        or copies them.
+        """
+        for array in (self._counts, self._index, self._values):
+            if array is not None:
+                array.flags.writeable = False
+        twin = NumpyHllSet.__new__(NumpyHllSet)
+        twin.P = self.P
+        twin._counts, twin._index, twin._values = self._counts, self._index, self._values
+        twin._ids = dict(self._ids)
+        return twin
+
+    def _nbytes(self):
+        return sum(a.nbytes for a in (self._counts, self._index, self._values) if a is not None)
+
+    @property
+    def is_sparse(self):
+        """True while only the touched registers are stored."""
+        return self._counts is None
+
+    @property
+    def counts(self):
+        """
+        Dense register array, as a read-only view: writing into the
+        registers would bypass the id and result caches. While sparse this
+        is a freshly materialized array, so writing into it does not change
+        the HllSet.
+        """
+        if self._counts is None:
+            counts = np.zeros(1 << self.P, dtype=np.uint32)
+            counts[self._index] = self._values
+            return counts
+        counts = self._counts.view()
+        counts.flags.writeable = False
+        return counts
+
+    @counts.setter
+    def counts(self, counts):
+        self._counts = counts
+        self._index = None
+        self._values = None
+        self._ids = {}
+
+    def registers(self):
+        """
+        Non-zero registers as (index, values), index ascending.
+        """
+        if self._counts is None:
+            return self._index, self._values
+        index = np.flatnonzero(self._counts).astype(np.uint32)
+        return index, self._counts[index]
+
+    def densify(self):
+        """Switch to the dense register array."""
+        if self._counts is None:
+            ids = self._ids
+            self.counts = self.counts
+            # Same registers, so the ids still hold
+            self._ids = ids
+
+    def _set_registers(self, index, values):
+        """Adopt sorted sparse registers, promoting to dense past the fill limit."""
+        if index.size > (1 << self.P) * SPARSE_MAX_FILL:
+            counts = np.zeros(1 << self.P, dtype=np.uint32)
+            counts[index] = values
+            self.counts = counts
+        else:
+            self._counts = None
+            self._index = index
+            self._values = values
+            self._ids = {}
+
+    def _registers_at(self, index):
+        """Register values at the given sorted indices."""
+        if self._counts is not None:
+            return self._counts[index]
+        if self._index.size == 0:
+            return np.zeros(index.size, dtype=np.uint32)
+        pos = np.minimum(np.searchsorted(self._index, index), self._index.size - 1)
+        return np.where(self._index[pos] == index, self._values[pos], np.uint32(0)).astype(np.uint32)
+
+    def add(self, element):
+        """
+        Add an element to the HllSet.
+        """
+        self.add_batch([element])
+
+    def add_batch(self, elements):
+        """
+        Add a batch of elements to the HllSet.
+
+        The whole batch is hashed into one array and OR-ed into the
+        registers in a single vectorized pass.
+        """
+        hashes = hash_tokens(elements)
+        if hashes.size == 0:
+            return
+        bins = getbin(hashes, self.P)
+        zeros = getzeros(hashes, self.P)
+        keep = zeros <= 32
+        bits = np.left_shift(np.uint32(1), (zeros[keep] - 1).astype(np.uint32))
+        if self._counts is None:
+            self._set_registers(*_merge_registers(
+                np.concatenate((self._index, bins[keep].astype(np.uint32))),
+                np.concatenate((self._values, bits))
+            ))
+        else:
+            np.bitwise_or.at(self._writable_counts(), bins[keep], bits)
+            self._ids = {}
+
+    def add_stream(self, elements, chunk_size=100_000):
+        """
+        Add an iterable of elements in chunks of chunk_size, hashing each
+        chunk in one vectorized pass with bounded memory.
+        """
+        for chunk in _chunks(elements, chunk_size):
+            self.add_batch(chunk)
+
+    def count(self):
+        """
+        Estimate the cardinality of the HllSet, memoized in hll_cache.
+        """
+        return _cached_count(self, self._count)
+
+    def _count(self):
+        m = 1 << self.P
+        values = self._values if self._counts is None else self._counts
+        # maxidx: position of the highest set bit in each register;
+        # registers not stored while sparse are zero and add 2^0 each
+        _, maxidx = np.frexp(values.astype(np.float64))
+        inverse_sum = (m - values.size) + np.ldexp(1.0, -maxidx).sum()
+        return int(_estimate(self.P, np.array([inverse_sum]))[0])
+
+    def _writable_counts(self):
+        """
+        Registers adopted zero-copy from a read-only buffer (e.g. bytes
+        from Redis) are copied on first mutation.
+        """
+        if not self._counts.flags.writeable:
+            self._counts = self._counts.copy()
+        return self._counts
+
+    def _validate_compatible(self, other):
+        if self.P != other.P:
+            raise ValueError("HLL sets must have same precision")
+
+    def union(self, other):
+        """
+        Perform a union with another HllSet, memoized in hll_cache.
+        """
+        self._validate_compatible(other)
+        return _cached_operation("union", self, other, lambda: self._union(other))
+
+    def _union(self, other):
+        if self.is_sparse and other.is_sparse:
+            return NumpyHllSet.from_sparse(self.P, *_merge_registers(
+                np.concatenate((self._index, other._index)),
+                np.concatenate((self._values, other._values))
+            ))
+        if self.is_sparse or other.is_sparse:
+            sparse, dense = (self, other) if self.is_sparse else (other, self)
+            counts = dense._counts.copy()
+            counts[sparse._index] |= sparse._values
+            return NumpyHllSet.from_counts(counts)
+        return NumpyHllSet.from_counts(self._counts | other._counts)
+
+    def intersection(self, other):
+        """
+        Perform an intersection with another HllSet, memoized in hll_cache.
+        """
+        self._validate_compatible(other)
+        return _cached_operation("intersection", self, other, lambda: self._intersection(other))
+
+    def _intersection(self, other):
+        if self.is_sparse or other.is_sparse:
+            sparse, other = (self, other) if self.is_sparse else (other, self)
+            values = sparse._values & other._registers_at(sparse._index)
+            keep = values != 0
+            return NumpyHllSet.from_sparse(self.P, sparse._index[keep], values[keep])
+        return NumpyHllSet.from_counts(self._counts & other._counts)
+
+    def difference(self, other):
+        """
+        Perform a difference with another HllSet.
+        Returns three HllSets: deleted, retained, and new.
+        """
+        return (
+            self.complement(other),
+            self.intersection(other),
+            other.complement(self)
+        )
+
+    def complement(self, other):
+        """
+        Perform a complement operation with another HllSet.
+        """
+        self._validate_compatible(other)
+        if self.is_sparse:
+            values = self._values & ~other._registers_at(self._index)
+            keep = values != 0
+            return NumpyHllSet.from_sparse(self.P, self._index[keep], values[keep])
+        if other.is_sparse:
+            counts = self._counts.copy()
+            counts[other._index] &= ~other._values
+            return NumpyHllSet.from_counts(counts)
+        return NumpyHllSet.from_counts(~other._counts & self._counts)
+
+    def id(self, hash_name="sha1"):
+        """
+        Content hash of the HllSet counts, SHA1 unless hash_name says
+        otherwise, cached until the registers change through add/add_batch
+        or the counts setter.
+        """
+        content_id = self._ids.get(hash_name)
+        if content_id is None:
+            counts = np.ascontiguousarray(self.counts, dtype="<u4")
+            content_id = self._ids[hash_name] = content_hash(counts, hash_name)
+        return content_id
+
+    def _cache_id(self):
+        """
+        Content hash keying hll_cache entries. A sparse set hashes only its
+        (index, values) entries, never materializing the 2^P registers.
+        """
+        content_id = self._ids.get("cache")
+        if content_id is None:
+            if self.is_sparse:
+                data = self._index.astype("<u4").tobytes() + self._values.astype("<u4").tobytes()
+            else:
+                data = np.ascontiguousarray(self._counts, dtype="<u4")
+            content_id = self._ids["cache"] = content_hash(data, _CACHE_HASH)
+        return content_id
+
+    def __eq__(self, other):
+        """Compare two HllSets for equality."""
+        if not isinstance(other, NumpyHllSet):
+            return False
+        self._validate_compatible(other)
+        if self.is_sparse and other.is_sparse:
+            return bool(np.array_equal(self._index, other._index) and np.array_equal(self._values, other._values))
+        return bool(np.array_equal(self.counts, other.counts))
+
+    def to_binary_tensor(self):
+        """
+        Convert the HllSet to a binary tensor of shape (2^P, 32), most
+        significant bit first, like HllSets.to_binary_tensor.
+        """
+        return to_binary_tensors(self.counts[np.newaxis], dtype=bool)[0]
+
+    @classmethod
+    def from_dict(cls, redis_data: dict, P: int = 10):
+        """
+        Create an HllSet from Redis hash data.
+
+        Args:
+            redis_data: The dictionary returned by redis.hgetall(redis_key).
+            P: The precision for the HllSet.
+
+        Returns:
+            An HllSet object.
+        """
+        if not redis_data:
+            raise ValueError("Redis data is empty or invalid")
+
+        hll = cls(P)
+        elements = []
+        for key, value in redis_data.items():
+            elements.append(key.decode() if isinstance(key, bytes) else key)
+            elements.append(value.decode() if isinstance(value, bytes) else value)
+        hll.add_batch(elements)
+
+        return hll
+
+    @classmethod
+    def from_counts(cls, counts):
+        """
+        Create an HllSet from a register array of length 2^P.
+        """
+        counts = np.asarray(counts, dtype=np.uint32)
+        hll = cls(_precision_of(counts))
+        hll.counts = counts
+        return hll
+
+    @classmethod
+    def from_iterable(cls, tokens, P: int = 10, workers=None, chunk_size: int = 100_000):
+        """
+        Build an HllSet from a (possibly huge) token iterable on several
+        worker processes, see build_registers. workers=1 builds in process.
+        """
+        if workers == 1:
+            hll = cls(P)
+            hll.add_stream(tokens, chunk_size=chunk_size)
+            return hll
+        return cls.from_counts(build_registers(tokens, P, workers, chunk_size, backend="numpy"))
+
+    @classmethod
+    def from_sparse(cls, P, index, values):
+        """
+        Create an HllSet from non-zero registers, index sorted ascending
+        and unique. Large inputs are promoted to dense.
+        """
+        index = np.asarray(index, dtype=np.uint32)
+        values = np.asarray(values, dtype=np.uint32)
+        if index.shape != values.shape or index.ndim != 1:
+            raise ValueError("Register index and values must be 1-D arrays of equal length")
+        if index.size and index[-1] >= 1 << P:
+            raise ValueError(f"Register index out of range for P={P}")
+        hll = cls(P)
+        hll._set_registers(index, values)
         return hll
 
     def __repr__(self):
-        return f"HllSet(P={self.P}, count={self.count()})"
\ No newline at end of file
+        return f"HllSet(P={self.P}, count={self.count()})"
+
+
+# Active backend ----------------------------------------------------------
+# ==============================================================================
+
+HllSet = NumpyHllSet if hllsets_backend == "numpy" else JuliaHllSet
+
+
+# Parallel construction ---------------------------------------------------
+# ==============================================================================
+
+_BACKENDS = {"julia": JuliaHllSet, "numpy": NumpyHllSet}
+
+# Builder process pools by worker count, started on first use and reused
+_builder_pools = {}
+_builder_lock = threading.Lock()
+
+
+def _builder_pool(workers):
+    with _builder_lock:
+        pool = _builder_pools.get(workers)
+        if pool is None:
+            # Julia builders boot their own runtime in each worker; a fork of
+            # a caller that already started Julia would inherit a dead copy
+            pool = _builder_pools[workers] = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+    return pool
+
+
+def _partial_registers(backend, P, tokens):
+    """Registers of one chunk of tokens, built inside a builder worker."""
+    hll = _BACKENDS[backend](P)
+    hll.add_batch(tokens)
+    return np.asarray(hll.counts, dtype=np.uint32)
+
+
+def build_registers(tokens, P=10, workers=None, chunk_size=100_000, backend=None):
+    """
+    Build the register array of a token stream on several processes.
+
+    The stream is cut into chunks of chunk_size that are hashed into
+    partial registers by a pool of worker processes; register OR is
+    commutative and idempotent, so the partials are OR-ed together as
+    they complete. At most 2 * workers chunks are in flight, which bounds
+    memory for arbitrarily long streams.
+
+    Every chunk is pickled to a worker by the calling process, so whether
+    this beats a single-process add_stream depends on the machine and the
+    tokens; check with bench_hllset.py before relying on it.
+
+    Args:
+        tokens: Iterable of tokens.
+        P: Precision.
+        workers: Worker processes, os.cpu_count() by default.
+        chunk_size: Tokens per task.
+        backend: "julia" or "numpy", the active backend by default.
+            Workers hash with this backend so the registers match it.
+
+    Returns:
+        uint32 array of 2^P registers.
+    """
+    workers = workers or os.cpu_count() or 1
+    backend = backend or hllsets_backend
+    pool = _builder_pool(workers)
+    counts = np.zeros(1 << P, dtype=np.uint32)
+    pending = set()
+    try:
+        for chunk in _chunks(tokens, chunk_size):
+            pending.add(pool.submit(_partial_registers, backend, P, chunk))
+            if len(pending) >= 2 * workers:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    counts |= future.result()
+        for future in concurrent.futures.as_completed(pending):
+            counts |= future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+    return counts
+
+
+# Similarity --------------------------------------------------------------
+# ==============================================================================
+
+SIMILARITY_METRICS = ("jaccard", "cosine")
+
+# Bytes of float temporaries per pair block; sets the default block edge
+SIMILARITY_BLOCK_BYTES = 16 << 20
+
+# 2^-maxidx for every possible maxidx of a uint32 register
+_NEG_POW2 = np.ldexp(np.float32(1.0), -np.arange(33)).astype(np.float32)
+
+
+def _register_matrix(hllsets):
+    """Stack HllSets (or pass through a register matrix) as an (N, 2^P) uint32 array."""
+    if isinstance(hllsets, np.ndarray):
+        counts = np.asarray(hllsets, dtype=np.uint32)
+    else:
+        counts = np.stack([np.asarray(hll.counts, dtype=np.uint32) for hll in hllsets])
+    if counts.ndim != 2:
+        raise ValueError("Register matrix must be 2-D, one HllSet per row")
+    return counts
+
+
+def _maxidx(counts):
+    """Position of the highest set bit of every register, as uint8."""
+    maxidx = np.empty(counts.shape, dtype=np.uint8)
+    for start in range(0, counts.shape[0], COUNT_MANY_BLOCK):
+        _, maxidx[start:start + COUNT_MANY_BLOCK] = np.frexp(
+            counts[start:start + COUNT_MANY_BLOCK].astype(np.float64)
+        )
+    return maxidx
+
+
+def _jaccard_block(P, maxidx_a, maxidx_b, counts_a, counts_b):
+    """
+    Jaccard of every pair of a row block and a column block by
+    inclusion-exclusion, |A & B| = |A| + |B| - |A | B|.
+
+    maxidx of a register union is the larger of the two, so the union
+    estimates need no union registers: 2^-maxidx(a | b) = min(2^-maxidx(a), 2^-maxidx(b)).
+    """
+    weights_a = _NEG_POW2[maxidx_a]
+    weights_b = _NEG_POW2[maxidx_b]
+    inverse_sums = np.minimum(weights_a[:, None, :], weights_b[None, :, :]).sum(axis=-1, dtype=np.float64)
+    union = _estimate(P, inverse_sums).astype(np.float64)
+    intersection = counts_a[:, None] + counts_b[None, :] - union
+    with np.errstate(divide="ignore", invalid="ignore"):
+        jaccard = np.where(union > 0, intersection / union, 0.0)
+    return np.clip(jaccard, 0.0, 1.0)
+
+
+def _cosine_block(registers_a, registers_b, norms_a, norms_b):
+    """Cosine of the raw register vectors of every pair, as HllSets.cosine."""
+    dots = registers_a.astype(np.float64) @ registers_b.astype(np.float64).T
+    norms = norms_a[:, None] * norms_b[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(norms > 0, dots / norms, 0.0)
+
+
+def _sparsify(strip, row0, top_k, threshold):
+    """Keep the top_k and/or >= threshold scores of each row as (rows, cols, scores)."""
+    if top_k is not None and top_k < strip.shape[1]:
+        cols = np.argpartition(-strip, top_k - 1, axis=1)[:, :top_k]
+    else:
+        cols = np.broadcast_to(np.arange(strip.shape[1]), strip.shape)
+    scores = np.take_along_axis(strip, cols, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    cols = np.take_along_axis(cols, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    rows = np.broadcast_to(np.arange(row0, row0 + strip.shape[0])[:, None], cols.shape)
+    keep = np.isfinite(scores)
+    if threshold is not None:
+        keep &= scores >= threshold
+    return rows[keep], cols[keep], scores[keep]
+
+
+def similarity_matrix(a, b=None, metric="jaccard", top_k=None, threshold=None,
+                      workers=None, block_size=None):
+    """
+    All-pairs similarity between two collections of HllSets.
+
+    Pairs are scored in (block_size x block_size) blocks so the
+    temporaries stay cache and memory friendly, and row strips run on a
+    thread pool (the NumPy kernels release the GIL). Jaccard uses
+    inclusion-exclusion on union estimates and never builds union or
+    intersection HllSets; cosine matches HllSets.cosine.
+
+    Args:
+        a: N HllSets, or an (N, 2^P) register matrix.
+        b: M HllSets or register matrix; a against itself when omitted.
+        metric: "jaccard" or "cosine".
+        top_k: Keep only the k best columns of each row.
+        threshold: Keep only scores >= threshold.
+        workers: Threads, os.cpu_count() by default.
+        block_size: Rows/columns per block, from SIMILARITY_BLOCK_BYTES by default.
+
+    Returns:
+        Dense (N, M) float64 matrix, or when top_k or threshold is given a
+        sparse (rows, cols, scores) triple, each row's entries by descending
+        score. Self-pairs are left out of the sparse form when b is omitted.
+    """
+    if metric not in SIMILARITY_METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {SIMILARITY_METRICS}")
+    if top_k is not None and top_k < 1:
+        raise ValueError("top_k must be positive")
+
+    self_pairs = b is None
+    counts_a = _register_matrix(a)
+    counts_b = counts_a if self_pairs else _register_matrix(b)
+    if counts_a.shape[1] != counts_b.shape[1]:
+        raise ValueError("HLL sets must have same precision")
+    P = _precision_of(counts_a[0] if counts_a.shape[0] else np.empty(counts_a.shape[1]))
+    n, m = counts_a.shape[0], counts_b.shape[0]
+    if block_size is None:
+        block_size = max(1, int((SIMILARITY_BLOCK_BYTES / (4 << P)) ** 0.5))
+
+    if metric == "jaccard":
+        maxidx_a = _maxidx(counts_a)
+        maxidx_b = maxidx_a if self_pairs else _maxidx(counts_b)
+        estimates_a = count_many(counts_a).astype(np.float64)
+        estimates_b = estimates_a if self_pairs else count_many(counts_b).astype(np.float64)
+
+        def block(i0, i1, j0, j1):
+            return _jaccard_block(P, maxidx_a[i0:i1], maxidx_b[j0:j1], estimates_a[i0:i1], estimates_b[j0:j1])
+    else:
+        norms_a = np.linalg.norm(counts_a.astype(np.float64), axis=1)
+        norms_b = norms_a if self_pairs else np.linalg.norm(counts_b.astype(np.float64), axis=1)
+
+        def block(i0, i1, j0, j1):
+            return _cosine_block(counts_a[i0:i1], counts_b[j0:j1], norms_a[i0:i1], norms_b[j0:j1])
+
+    sparse = top_k is not None or threshold is not None
+
+    def strip(i0):
+        i1 = min(i0 + block_size, n)
+        scores = np.empty((i1 - i0, m))
+        for j0 in range(0, m, block_size):
+            j1 = min(j0 + block_size, m)
+            scores[:, j0:j1] = block(i0, i1, j0, j1)
+        if not sparse:
+            return scores
+        if self_pairs:
+            scores[np.arange(i1 - i0), np.arange(i0, i1)] = -np.inf
+        return _sparsify(scores, i0, top_k, threshold)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        strips = list(pool.map(strip, range(0, n, block_size)))
+
+    if not sparse:
+        return np.vstack(strips) if strips else np.empty((0, m))
+    if not strips:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    rows, cols, scores = zip(*strips)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+
+# Register signatures -----------------------------------------------------
+# ==============================================================================
+
+# Seed of the signature hash family; fixed so signatures computed in any
+# process are comparable
+SIGNATURE_SEED = 0x5347535F
+
+# Set register bits hashed per step, bounding the (num_hashes, chunk) temporaries
+_SIGNATURE_CHUNK = 4096
+
+
+def register_signature(counts, num_hashes=64):
+    """
+    MinHash signature of the set register bits of an HllSet.
+
+    A union of HllSets sets the union of their register bits, so the
+    fraction of equal signature entries estimates the Jaccard of the bit
+    sets, which tracks the Jaccard of the token sets; this is what the
+    LSH index in meta_redis buckets on. Each hash is a multiply-shift
+    hash of the bit position (register * 32 + bit).
+
+    Args:
+        counts: Register array of 2^P uint32.
+        num_hashes: Signature length.
+
+    Returns:
+        uint32 array of num_hashes minima, or None for an empty HllSet.
+    """
+    counts = np.asarray(counts, dtype=np.uint32)
+    bits = np.unpackbits(counts.astype(">u4").view(np.uint8))
+    positions = np.flatnonzero(bits).astype(np.uint64)
+    if positions.size == 0:
+        return None
+    rng = np.random.default_rng(SIGNATURE_SEED)
+    a = rng.integers(1, 1 << 63, num_hashes, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, num_hashes, dtype=np.uint64)
+    signature = np.full(num_hashes, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, positions.size, _SIGNATURE_CHUNK):
+        chunk = positions[start:start + _SIGNATURE_CHUNK]
+        hashed = (a[:, None] * chunk[None, :] + b[:, None]) >> np.uint64(32)
+        signature = np.minimum(signature, hashed.min(axis=1))
+    return signature.astype(np.uint32)
+
+
+# Tensor export -----------------------------------------------------------
+# ==============================================================================
+#
+# An HllSet as a tensor is its (2^P, 32) register bit matrix, most
+# significant bit first, like HllSets.to_binary_tensor; a batch of N sets
+# is an (N, 2^P, 32) array ready for torch.from_numpy or tensorly.
+
+
+def to_binary_tensors(hllsets, dtype=np.uint8) -> np.ndarray:
+    """
+    Register bits of a batch of HllSets as an (N, 2^P, 32) array.
+
+    The bits are unpacked straight from a byte view of the registers
+    (reversed per register on little-endian hosts), so the only
+    allocation is the output itself, which is C-contiguous.
+
+    Args:
+        hllsets: HllSets of one precision, or an (N, 2^P) register matrix.
+        dtype: np.uint8 or bool; bool is a view of the same buffer.
+
+    Returns:
+        Array of shape (N, 2^P, 32).
+    """
+    if np.dtype(dtype) not in (np.dtype(np.uint8), np.dtype(bool)):
+        raise ValueError("Binary tensors are uint8 or bool")
+    counts = np.ascontiguousarray(_register_matrix(hllsets))
+    register_bytes = counts.view(np.uint8).reshape(counts.shape + (4,))
+    if sys.byteorder == "little":
+        register_bytes = register_bytes[..., ::-1]
+    tensor = np.unpackbits(register_bytes, axis=-1)
+    return tensor.view(bool) if np.dtype(dtype) == np.dtype(bool) else tensor
+
+
+def from_binary_tensors(tensor) -> np.ndarray:
+    """
+    Register matrix of an (N, 2^P, 32) or (2^P, 32) binary tensor, the
+    inverse of to_binary_tensors. Any non-zero entry is a set bit.
+
+    Returns:
+        (N, 2^P) uint32 array, or (2^P,) for a single tensor.
+    """
+    tensor = np.asarray(tensor)
+    if tensor.ndim not in (2, 3) or tensor.shape[-1] != 32:
+        raise ValueError("Binary tensor must have shape (N, 2^P, 32) or (2^P, 32)")
+    _precision_of(np.empty(tensor.shape[-2]))
+    packed = np.packbits(tensor, axis=-1)
+    return packed.view(">u4")[..., 0].astype(np.uint32)
+
+
+def binary_tensors_to_hllsets(tensor) -> list:
+    """HllSets (of the active backend) of an (N, 2^P, 32) binary tensor."""
+    counts = from_binary_tensors(tensor)
+    return [HllSet.from_counts(row) for row in np.atleast_2d(counts)]
+
+
+# Binary codec ------------------------------------------------------------
+# ==============================================================================
+#
+# Stored layout (little-endian), header then payload:
+#
+#   magic   4s   b"HLLS"
+#   version u8   CODEC_VERSION
+#   P       u8   precision, 2^P registers
+#   enc     u8   ENCODING_DENSE or ENCODING_SPARSE
+#   pad     x
+#   n       u32  number of uint32 entries in each payload array
+#
+#   dense:  n = 2^P uint32 registers
+#   sparse: n uint32 register indices (ascending), then n uint32 values
+#
+# The encoder picks whichever payload is smaller. The 12-byte header keeps
+# the payload 4-byte aligned so it decodes with np.frombuffer, no copy.
+
+CODEC_MAGIC = b"HLLS"
+CODEC_VERSION = 1
+ENCODING_DENSE = 0
+ENCODING_SPARSE = 1
+
+_HEADER = struct.Struct("<4sBBBxI")
+
+
+def encode_hllset(hll) -> bytes:
+    """
+    Serialize an HllSet to the versioned binary format.
+
+    Args:
+        hll: HllSet of either backend.
+
+    Returns:
+        bytes: header plus dense or sparse register payload.
+    """
+    if isinstance(hll, NumpyHllSet) and hll.is_sparse:
+        P = hll.P
+        index, values = hll.registers()
+        size = 1 << P
+        counts = None
+    else:
+        counts = np.asarray(hll.counts, dtype="<u4")
+        P = _precision_of(counts)
+        index = np.flatnonzero(counts)
+        values = counts[index]
+        size = counts.size
+    if 2 * index.size < size:
+        header = _HEADER.pack(CODEC_MAGIC, CODEC_VERSION, P, ENCODING_SPARSE, index.size)
+        return header + index.astype("<u4").tobytes() + values.astype("<u4").tobytes()
+    if counts is None:
+        counts = np.asarray(hll.counts, dtype="<u4")
+    header = _HEADER.pack(CODEC_MAGIC, CODEC_VERSION, P, ENCODING_DENSE, size)
+    return header + counts.tobytes()
+
+
+def _decode(data: bytes, P=None):
+    """
+    Parse encoded bytes without copying the payload.
+
+    Values without the codec header are only read as a pre-codec raw
+    register dump when P is given and the length is exactly 2^P uint32;
+    anything else (e.g. a SETBIT bitmap) is rejected.
+
+    Returns:
+        Tuple of (P, index, values): index is None for dense payloads, in
+        which case values holds all 2^P registers.
+    """
+    if data[:4] != CODEC_MAGIC:
+        if P is None or len(data) != 4 << P:
+            raise ValueError(
+                f"Value is not an encoded HllSet ({len(data)} bytes without codec header"
+                + ("" if P is None else f", expected {4 << P} for raw P={P} registers") + ")"
+            )
+        return P, None, np.frombuffer(data, dtype="<u4")
+
+    magic, version, P, encoding, n = _HEADER.unpack_from(data)
+    if version != CODEC_VERSION:
+        raise ValueError(f"Unsupported HllSet codec version {version}")
+
+    if encoding == ENCODING_DENSE:
+        if n != 1 << P:
+            raise ValueError(f"Dense payload holds {n} registers, expected {1 << P}")
+        return P, None, np.frombuffer(data, dtype="<u4", count=n, offset=_HEADER.size)
+    if encoding == ENCODING_SPARSE:
+        index = np.frombuffer(data, dtype="<u4", count=n, offset=_HEADER.size)
+        values = np.frombuffer(data, dtype="<u4", count=n, offset=_HEADER.size + 4 * n)
+        return P, index, values
+    raise ValueError(f"Unknown HllSet encoding {encoding}")
+
+
+def decode_registers(data: bytes, P=None) -> np.ndarray:
+    """
+    Decode bytes written by encode_hllset into a dense register array.
+
+    Dense payloads are returned as a read-only view of data. Raw uint32
+    register dumps without a header (the pre-codec format) are accepted
+    as dense registers when they hold exactly 2^P of them.
+    """
+    P, index, values = _decode(data, P)
+    if index is None:
+        return values
+    counts = np.zeros(1 << P, dtype=np.uint32)
+    counts[index] = values
+    return counts
+
+
+def decode_hllset(data: bytes, P=None):
+    """
+    Rebuild an HllSet of the active backend from encode_hllset output.
+    Sparse payloads stay sparse on the NumPy backend. P is the precision
+    of pre-codec values, see decode_registers.
+    """
+    if HllSet is NumpyHllSet:
+        P, index, values = _decode(data, P)
+        if index is not None:
+            return NumpyHllSet.from_sparse(P, index, values)
+    return HllSet.from_counts(decode_registers(data, P))
@@ -31,10 +31,7 @@ class HDF5Store:
             group = f.get("hllsets")
             if group is None or key not in group:
                 return None
-            counts = group[key][:]
-            hllset = HllSet(P)
-            hllset.counts = counts
-            return hllset
+            return HllSet.from_counts(group[key][:])
 
 def call_hdf5(**kwargs):
     """
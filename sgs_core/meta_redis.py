@@ -1,20 +1,462 @@
+import hashlib
 import mmh3
+import itertools
 import json
+from collections import Counter
 import time
-from typing import Dict, List, Optional, Tuple, Union
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import uuid
 import redis
+import redis.asyncio
 import numpy as np
 from redis.commands.search.field import TextField, NumericField, TagField
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
-from meta_algebra import HllSet
+from meta_algebra import (
+    HllSet, encode_hllset, decode_hllset, decode_registers, register_signature, similarity_matrix
+)
+
+# Upsert a chunk of token index entries server-side.
+# KEYS: (meta:tokens:<hash>, meta:token_refs:<hash>) pairs. ARGV[1]: interned
+# ref id, ARGV[2]: '1' to keep refs in a roaring bitmap, '0' for a Redis set,
+# then per token the (TF increment, hash, bin, zeros) quadruple.
+TOKEN_INDEX_LUA = """
+local ref = ARGV[1]
+local roaring = ARGV[2] == '1'
+for i = 1, #KEYS, 2 do
+    local key, refs_key = KEYS[i], KEYS[i + 1]
+    local base = 3 + (i - 1) * 2
+    redis.call('HINCRBY', key, 'TF', ARGV[base])
+    if roaring then
+        redis.call('R.SETBIT', refs_key, ref, 1)
+    else
+        redis.call('SADD', refs_key, ref)
+    end
+    redis.call('HSETNX', key, 'hash', ARGV[base + 1])
+    redis.call('HSETNX', key, 'bin', ARGV[base + 2])
+    redis.call('HSETNX', key, 'zeros', ARGV[base + 3])
+end
+return #KEYS / 2
+"""
+
+# Intern an HLL SHA1 as a compact integer id.
+# KEYS: sha1 -> id hash, id -> sha1 hash, id counter. ARGV[1]: SHA1.
+INTERN_LUA = """
+local id = redis.call('HGET', KEYS[1], ARGV[1])
+if id then
+    return tonumber(id)
+end
+id = redis.call('INCR', KEYS[3])
+redis.call('HSET', KEYS[1], ARGV[1], id)
+redis.call('HSET', KEYS[2], id, ARGV[1])
+return id
+"""
+
+# Move a location's current head edges to edge:tail: and make the new edge
+# its only head.
+# KEYS[1]: meta:heads:<loc_sha1> set of head edge keys. ARGV[1]: new head
+# edge key. The head keys themselves come from the set, so this assumes a
+# single (non-cluster) Redis, like the rest of the store.
+ARCHIVE_HEADS_LUA = """
+local heads = redis.call('SMEMBERS', KEYS[1])
+for _, key in ipairs(heads) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('RENAME', key, 'edge:tail:' .. string.sub(key, 11))
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('SADD', KEYS[1], ARGV[1])
+return #heads
+"""
+
+# N-ary register operation on HllSets stored by encode_hllset, see the codec
+# in meta_algebra.
+# KEYS[1]: destination, KEYS[2..]: sources. ARGV[1]: 'or', 'and' or 'diff'
+# (first source minus the union of the others), ARGV[2]: '1' to store the
+# result in KEYS[1], ARGV[3]: expiry in seconds or '', ARGV[4]: precision
+# of pre-codec values, which are only accepted at exactly 2^P uint32.
+# Returns the encoded result. Dense values with identical headers OR/AND
+# byte-wise, header included, so those go through BITOP; anything else
+# (sparse, pre-codec, diff) is merged as maps of non-zero registers, in
+# time proportional to their entries, and the result is encoded sparse or
+# dense by the same size rule as encode_hllset.
+SET_OPERATION_LUA = """
+local op, store, ex, legacy_p = ARGV[1], ARGV[2] == '1', tonumber(ARGV[3]), tonumber(ARGV[4])
+local values, header = {}, nil
+local bitop = op ~= 'diff' and #KEYS <= 1000
+for i = 2, #KEYS do
+    local v = redis.call('GET', KEYS[i])
+    if not v then
+        return redis.error_reply('HllSet ' .. KEYS[i] .. ' not found')
+    end
+    values[i - 1] = v
+    local h = string.sub(v, 1, 12)
+    if string.sub(v, 1, 4) ~= 'HLLS' or string.byte(v, 7) ~= 0 or (header and h ~= header) then
+        bitop = false
+    end
+    header = header or h
+end
+
+if bitop then
+    redis.call('BITOP', string.upper(op), KEYS[1], unpack(KEYS, 2))
+    local result = redis.call('GET', KEYS[1])
+    if not store then
+        redis.call('DEL', KEYS[1])
+    elseif ex then
+        redis.call('EXPIRE', KEYS[1], ex)
+    end
+    return result
+end
+
+-- Non-zero registers of a value as {[0-based register index] = value}, so
+-- sparse values cost their entry count rather than 2^P
+local function registers(v)
+    local regs = {}
+    if string.sub(v, 1, 4) ~= 'HLLS' then
+        -- Pre-codec raw dense registers
+        if #v ~= 4 * 2 ^ legacy_p then
+            error('Value is not an encoded HllSet (' .. #v .. ' bytes without codec header)')
+        end
+        for i = 0, 2 ^ legacy_p - 1 do
+            local r = struct.unpack('<I4', v, 4 * i + 1)
+            if r ~= 0 then
+                regs[i] = r
+            end
+        end
+        return legacy_p, regs
+    end
+    local version, P, enc = string.byte(v, 5, 7)
+    if version ~= 1 then
+        error('Unsupported HllSet codec version ' .. version)
+    end
+    local n = struct.unpack('<I4', v, 9)
+    if enc == 0 then
+        for i = 0, n - 1 do
+            local r = struct.unpack('<I4', v, 13 + 4 * i)
+            if r ~= 0 then
+                regs[i] = r
+            end
+        end
+    else
+        local base = 13 + 4 * n
+        for j = 0, n - 1 do
+            regs[struct.unpack('<I4', v, 13 + 4 * j)] = struct.unpack('<I4', v, base + 4 * j)
+        end
+    end
+    return P, regs
+end
+
+local P, acc = registers(values[1])
+for k = 2, #values do
+    local Pk, regs = registers(values[k])
+    if Pk ~= P then
+        return redis.error_reply('HLL sets must have same precision')
+    end
+    if op == 'or' then
+        for i, r in pairs(regs) do
+            local a = acc[i]
+            acc[i] = a and bit.bor(a, r) or r
+        end
+    elseif op == 'and' then
+        for i, a in pairs(acc) do
+            local r = regs[i]
+            local m = r and bit.band(a, r) or 0
+            acc[i] = m ~= 0 and m or nil
+        end
+    else
+        for i, r in pairs(regs) do
+            local a = acc[i]
+            if a then
+                local m = bit.band(a, bit.bnot(r))
+                acc[i] = m ~= 0 and m or nil
+            end
+        end
+    end
+end
+
+local function u32(r)
+    if r < 0 then
+        r = r + 4294967296
+    end
+    return struct.pack('<I4', r)
+end
+
+local index = {}
+for i in pairs(acc) do
+    index[#index + 1] = i
+end
+table.sort(index)
+local n, out = #index, nil
+if 2 * n < 2 ^ P then
+    -- Sparse payload when smaller, the same rule as encode_hllset
+    out = {'HLLS', struct.pack('<BBBBI4', 1, P, 1, 0, n)}
+    for j = 1, n do
+        out[j + 2] = struct.pack('<I4', index[j])
+        out[n + j + 2] = u32(acc[index[j]])
+    end
+else
+    out = {'HLLS', struct.pack('<BBBBI4', 1, P, 0, 0, 2 ^ P)}
+    for i = 0, 2 ^ P - 1 do
+        out[i + 3] = u32(acc[i] or 0)
+    end
+end
+local result = table.concat(out)
+if store then
+    if ex then
+        redis.call('SET', KEYS[1], result, 'EX', ex)
+    else
+        redis.call('SET', KEYS[1], result)
+    end
+end
+return result
+"""
+
+# set_operation name -> SET_OPERATION_LUA register operation
+SET_OPERATIONS = {"union": "or", "intersection": "and", "difference": "diff"}
+
+# LSH index over committed dataset HllSets: LSH_BANDS bands of LSH_ROWS
+# signature entries each (see meta_algebra.register_signature). Sets whose
+# signatures agree on a whole band share that band's bucket
+LSH_BANDS = 16
+LSH_ROWS = 4
+LSH_KEY_PREFIX = "meta:lsh:"
+LSH_SIGNATURES_KEY = "meta:lsh:signatures"
+
+# Per-location set of current head edge keys
+HEADS_KEY_PREFIX = "meta:heads:"
+
+HLL_IDS_KEY = "meta:hll_ids"
+HLL_SHA1S_KEY = "meta:hll_sha1s"
+HLL_IDS_COUNTER_KEY = "meta:hll_ids:next"
+
+# Tokens sent to the token index script per call
+TOKEN_INDEX_CHUNK = 1000
+
+# ingest_stream: tokens hashed per add_batch call, and queued pipeline
+# commands that trigger a flush
+INGEST_CHUNK = 100_000
+PIPELINE_FLUSH = 100
+
+# Bump when _index_schemas changes. When the stored version is older (or
+# missing, as on servers set up before versioning) every index is dropped,
+# keeping its documents, and recreated from _index_schemas, which
+# re-indexes the existing hashes; the per-location head sets are
+# backfilled from the edge:head: hashes at the same time
+SCHEMA_VERSION = 3
+SCHEMA_VERSION_KEY = "meta:schema_version"
+
+# (host, port, db) whose indices are known current in this process
+_schema_ready = set()
+
+def _index_schemas():
+    """
+    Redisearch index definitions shared by RedisStore and AsyncRedisStore.
+
+    Returns:
+        List of (index_name, fields, key_prefixes).
+    """
+    edge_fields = [
+        TextField("e_sha1", sortable=True),
+        TextField("label", sortable=True),
+        TextField("left", sortable=True),
+        TextField("right", sortable=True),
+        TextField("attr"),
+        NumericField("timestamp", sortable=True)
+    ]
+    return [
+        # Head and tail indices share the same schema
+        ("edge:head", edge_fields, ["edge:head:"]),
+        ("edge:tail", edge_fields, ["edge:tail:"]),
+        # Combined index adds state tag
+        ("edge", edge_fields + [TagField("state")], ["edge:head:", "edge:tail:"]),
+        ("tokens", [
+            TextField("hash", sortable=True),
+            NumericField("bin", sortable=True),
+            NumericField("zeros", sortable=True),
+            NumericField("TF", sortable=True),
+            # TagField("type")  # 'location' or 'dataset'
+        ], ["meta:tokens:"]),
+        ("commits", [
+            TextField("c_sha1", sortable=True),
+            NumericField("timestamp", sortable=True),
+            TextField("edge_key")
+        ], ["meta:commits:"]),
+    ]
+
+
+def _token_hash(token: str) -> int:
+    """Unsigned 64-bit MurmurHash3 of a token, as used in token index keys."""
+    token_hash, _ = mmh3.hash64(token)
+    return token_hash & 0xFFFFFFFFFFFFFFFF
+
+
+def _token_index_calls(tokens: List[str], ref_id: int, roaring_refs: bool, P: int, chunk_size: int):
+    """
+    Aggregate tokens (one hash and one TF increment by the occurrence count
+    per unique token) and yield (keys, args) for one token index script
+    call per chunk of unique tokens.
+    """
+    token_counts = list(Counter(tokens).items())
+    for start in range(0, len(token_counts), chunk_size):
+        keys = []
+        args = [ref_id, 1 if roaring_refs else 0]
+        for token, tf in token_counts[start:start + chunk_size]:
+            token_hash = _token_hash(token)
+            keys.extend((f"meta:tokens:{token_hash:020}", f"meta:token_refs:{token_hash:020}"))
+            args.extend((
+                tf,
+                f"{token_hash:020}",
+                token_hash >> (64 - P),
+                (token_hash & -token_hash).bit_length() - 1 if token_hash != 0 else 0
+            ))
+        yield keys, args
+
+
+def _edge_data(loc_sha1: str, dataset_sha1: str, label: str, metadata: dict) -> Tuple[dict, str]:
+    """Prepare edge data dictionary and calculate content hash."""
+    attr = json.dumps(metadata or {})
+    edge_data = {
+        "label": label,
+        "left": loc_sha1,
+        "right": dataset_sha1,
+        "attr": attr
+    }
+
+    edge_sha1 = HllSet.from_dict(edge_data).id()
+
+    return edge_data, edge_sha1
+
+
+def _new_commit(edge_sha1: str) -> Tuple[str, str]:
+    """Fresh commit id and the head edge key it creates."""
+    commit_id = str(uuid.uuid1())
+    return commit_id, f"edge:head:{commit_id}:{edge_sha1}"
+
+
+def _queue_commit_writes(pipe, commit_id: str, edge_key: str, location_key: str, dataset_key: str,
+                         edge_data: dict, promote_location: bool = True,
+                         dataset_value: Optional[bytes] = None) -> Dict:
+    """
+    Queue the writes of one commit that follow archiving the location's
+    head edges. Queueing is synchronous on both redis and redis.asyncio
+    pipelines, so RedisStore and AsyncRedisStore share this; only the
+    archive script call differs.
+
+    Args:
+        promote_location: Rename the location buffer key; False when an
+            earlier commit in the same transaction already promoted it
+        dataset_value: Encoded dataset HllSet, added to the similarity
+            index under its promoted key
+
+    Returns:
+        Commit result, valid once the pipeline has executed
+    """
+    loc_sha1 = location_key[2:]
+    dataset_sha1 = dataset_key.split(":")[-1]
+    timestamp = int(time.time() * 1000)
+
+    # 2. Create new edge
+    pipe.hset(edge_key, mapping=dict(edge_data, timestamp=timestamp))
+
+    # 3. Promote to persistent storage
+    new_loc_key = f"rbs:{loc_sha1}"
+    new_dataset_key = f"rbs:{loc_sha1}:{dataset_sha1}"
+    if promote_location:
+        pipe.rename(location_key, new_loc_key)
+    pipe.rename(dataset_key, new_dataset_key)
+    if dataset_value is not None:
+        _queue_similarity_index(pipe, new_dataset_key, dataset_value)
+
+    # 4. Record commit
+    pipe.hset(f"meta:commits:{commit_id}", mapping={
+        "timestamp": timestamp,
+        "edge_key": edge_key
+    })
+
+    return {
+        "status": "success",
+        "commit_id": commit_id,
+        "edge_key": edge_key,
+        "location_key": new_loc_key,
+        "dataset_key": new_dataset_key
+    }
+
+
+def _set_operation_call(operation: str, keys: list, result_key: Optional[str],
+                        ex: Optional[int], P: int) -> Tuple[list, list]:
+    """
+    Validate a set_operation request and build the (keys, args) of its
+    SET_OPERATION_LUA call. Without result_key a scratch key is used and
+    nothing is kept.
+    """
+    if operation not in SET_OPERATIONS:
+        raise ValueError(f"Invalid operation. Must be one of {list(SET_OPERATIONS)}")
+    if not keys:
+        raise ValueError("At least one key required for set operations")
+    store = result_key is not None
+    destination = result_key if store else f"tmp:set_operation:{uuid.uuid4()}"
+    return [destination, *keys], [SET_OPERATIONS[operation], 1 if store else 0, "" if ex is None else ex, P]
+
+
+def _set_operation_result(result_key: Optional[str], encoded: bytes) -> Dict:
+    return {
+        "status": "success",
+        "result_key": result_key,
+        "count": decode_hllset(encoded).count()
+    }
+
+
+def _lsh_buckets(signature: np.ndarray, P: int) -> List[str]:
+    """Bucket keys of a signature, one per band."""
+    return [
+        f"{LSH_KEY_PREFIX}{P}:{band}:{hashlib.blake2b(rows.tobytes(), digest_size=8).hexdigest()}"
+        for band, rows in enumerate(signature.reshape(LSH_BANDS, LSH_ROWS))
+    ]
+
+
+def _queue_similarity_index(pipe, key: str, encoded: bytes, P: Optional[int] = None):
+    """
+    Queue adding an encoded HllSet under key to the LSH index: key joins
+    its band buckets and its signature is kept for candidate ranking.
+    Empty sets are not indexed. P is the precision of pre-codec values.
+    """
+    counts = decode_registers(encoded, P)
+    signature = register_signature(counts, LSH_BANDS * LSH_ROWS)
+    if signature is None:
+        return
+    for bucket in _lsh_buckets(signature, counts.size.bit_length() - 1):
+        pipe.sadd(bucket, key)
+    pipe.hset(LSH_SIGNATURES_KEY, key, signature.astype("<u4").tobytes())
+
+
+def _commit_args(commit: Union[Tuple, Dict]) -> Tuple[str, str, str, Optional[dict]]:
+    """Normalize one commit_many entry to (location_key, dataset_key, label, metadata)."""
+    if isinstance(commit, dict):
+        return (commit["location_key"], commit["dataset_key"],
+                commit.get("label", "id"), commit.get("metadata"))
+    location_key, dataset_key, *rest = commit
+    label = rest[0] if len(rest) > 0 else "id"
+    metadata = rest[1] if len(rest) > 1 else None
+    return location_key, dataset_key, label, metadata
+
+
+def _commit_error(location_key: str, dataset_key: str, message: str) -> Dict:
+    return {
+        "status": "error",
+        "message": message,
+        "location_key": location_key,
+        "dataset_key": dataset_key
+    }
+
 
 class RedisStore:
 
     # Redisearch client for advanced indexing and searching -------------------
     # ==============================================================================
 
-    def __init__(self, host='redis', port=6379, db=0):
+    def __init__(self, host='redis', port=6379, db=0, roaring_refs=True):
         """
         Initialize a connection to Redis with enhanced error handling.
         
@@ -22,7 +464,12 @@ class RedisStore:
             host: Redis host (default 'redis')
             port: Redis port (default 6379)
             db: Redis database number (default 0)
+            roaring_refs: Keep token refs in roaring bitmaps (needs the
+                redis-roaring module) instead of Redis sets
         """
+        self.roaring_refs = roaring_refs
+        self._hll_ids = {}
+        self._server = (host, port, db)
         self.redis = redis.Redis(
             host=host,
             port=port,
@@ -31,68 +478,46 @@ class RedisStore:
             socket_keepalive=True,
             decode_responses=False
         )
+        self._token_index_script = self.redis.register_script(TOKEN_INDEX_LUA)
+        self._intern_script = self.redis.register_script(INTERN_LUA)
+        self._archive_heads_script = self.redis.register_script(ARCHIVE_HEADS_LUA)
+        self._set_operation_script = self.redis.register_script(SET_OPERATION_LUA)
         self._initialize_indices()
 
     def _initialize_indices(self):
-        """Initialize all Redisearch indices with proper error handling."""
+        """
+        Initialize all Redisearch indices with proper error handling.
+
+        Runs at most once per server per process, and only touches the
+        indices when the server's stored schema version is older than
+        SCHEMA_VERSION; they are then dropped and recreated so definitions
+        from older versions don't survive the upgrade.
+        """
+        if self._server in _schema_ready:
+            return
         try:
-            self._create_edge_indices()
-            self._create_tokens_index()
-            self._create_commits_index()
-            print("Redisearch indices initialized successfully.")
+            stored = self.redis.get(SCHEMA_VERSION_KEY)
+            if stored is None or int(stored) < SCHEMA_VERSION:
+                for name, fields, prefixes in _index_schemas():
+                    try:
+                        self.redis.ft(name).dropindex(delete_documents=False)
+                    except redis.exceptions.ResponseError as e:
+                        if "unknown index" not in str(e).lower():
+                            raise
+                    try:
+                        self.redis.ft(name).create_index(fields, definition=IndexDefinition(prefix=prefixes))
+                    except redis.exceptions.ResponseError as e:
+                        if "Index already exists" not in str(e):
+                            raise
+                self.rebuild_heads()
+                self.redis.set(SCHEMA_VERSION_KEY, SCHEMA_VERSION)
+                print("Redisearch indices initialized successfully.")
+            _schema_ready.add(self._server)
         except redis.exceptions.ResponseError as e:
-            if "Index already exists" not in str(e):
-                print(f"Error creating indices: {e}")
+            print(f"Error creating indices: {e}")
         except redis.exceptions.RedisError as e:
             print(f"Redis error during initialization: {e}")
 
-    def _create_edge_indices(self):
-        """Create indices for edge tracking with optimized field definitions."""
-        edge_fields = [
-            TextField("e_sha1", sortable=True),
-            TextField("label", sortable=True),
-            TextField("left", sortable=True),
-            TextField("right", sortable=True),
-            TextField("attr"),
-            NumericField("timestamp", sortable=True)
-        ]
-        
-        # Head and tail indices share the same schema
-        self.redis.ft("edge:head").create_index(
-            edge_fields,
-            definition=IndexDefinition(prefix=["edge:head:"])
-        )
-        self.redis.ft("edge:tail").create_index(
-            edge_fields,
-            definition=IndexDefinition(prefix=["edge:tail:"])
-        )
-        
-        # Combined index adds state tag
-        combined_fields = edge_fields + [TagField("state")]
-        self.redis.ft("edge").create_index(
-            combined_fields,
-            definition=IndexDefinition(prefix=["edge:head:", "edge:tail:"])
-        )
-
-    def _create_tokens_index(self):
-        """Create optimized tokens index with better field definitions."""
-        self.redis.ft("tokens").create_index([
-            TextField("hash", sortable=True),
-            NumericField("bin", sortable=True),
-            NumericField("zeros", sortable=True),
-            NumericField("TF", sortable=True),
-            TagField("refs", separator=","),
-            # TagField("type")  # 'location' or 'dataset'
-        ], definition=IndexDefinition(prefix=["meta:tokens:"]))
-
-    def _create_commits_index(self):
-        """Create commits index."""
-        self.redis.ft("commits").create_index([
-            TextField("c_sha1", sortable=True),
-            NumericField("timestamp", sortable=True),
-            TextField("edge_key")
-        ], definition=IndexDefinition(prefix=["meta:commits:"]))
-
     # Data ingestion and processing -------------------------------------------
     # ==============================================================================
 
@@ -119,9 +544,9 @@ class RedisStore:
     def _process_tokens(self, loc_tokens: List[str], dataset_tokens: List[str]) -> Tuple[str, str]:
         """Process tokens and store HLLs with pipeline optimization."""
         # Create HLLs
-        loc_hll, loc_sha1 = self._create_hll_with_index(loc_tokens, "location")
+        loc_hll, loc_sha1 = self._create_hll_with_index(loc_tokens)
 
-        dataset_hll, dataset_sha1 = self._create_hll_with_index(dataset_tokens, "dataset", ref_sha1=loc_sha1)
+        dataset_hll, dataset_sha1 = self._create_hll_with_index(dataset_tokens, ref_sha1=loc_sha1)
 
         # Prepare keys
         loc_key = f"b:{loc_sha1}"
@@ -130,119 +555,207 @@ class RedisStore:
         # Pipeline operations
         pipe = self.redis.pipeline()
 
-        # Store HLL counts in Roaring Bitmap for location
+        # Store encoded HLL registers for location and dataset
         self.store_hllset(pipe, loc_key, loc_hll)
-        # Store HLL counts in Roaring Bitmap for dataset
         self.store_hllset(pipe, dataset_key, dataset_hll)
+        pipe.execute()
         
         return loc_key, dataset_key
     
 
+    def ingest_stream(self, pairs: Iterable[Tuple[Iterable[str], Iterable[str]]],
+                      chunk_size: int = INGEST_CHUNK,
+                      flush_every: int = PIPELINE_FLUSH) -> Iterator[Tuple[str, str]]:
+        """
+        Ingest a stream of location/dataset pairs with bounded memory.
+
+        Dataset tokens may be any iterable (e.g. a generator over a multi-GB
+        source); they are consumed chunk_size at a time, added to the HLL
+        and queued as token index updates, so only one chunk is held in
+        memory. Location tokens are materialized, because their token index
+        entries reference the location's own SHA1, known only once all of
+        them are seen. All writes share one pipeline that is flushed once it
+        holds flush_every commands. To ingest one huge dataset pass a single
+        pair, e.g. ingest_stream([(location_tokens, token_generator)]).
+
+        Args:
+            pairs: Iterable of (location_tokens, dataset_tokens)
+            chunk_size: Dataset tokens hashed and indexed per step
+            flush_every: Queued commands that trigger a pipeline flush
+
+        Yields:
+            (location_key, dataset_key) of each pair, once its writes have
+            been flushed to Redis
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        done = []
+
+        def flush():
+            pipe.execute()
+            completed = list(done)
+            done.clear()
+            return completed
+
+        for location_tokens, dataset_tokens in pairs:
+            location_tokens = list(location_tokens)
+            if not location_tokens:
+                raise ValueError("Tokens cannot be empty")
+
+            loc_hll = HllSet()
+            loc_hll.add_batch(location_tokens)
+            loc_sha1 = loc_hll.id()
+            # Location and dataset tokens both reference the location
+            ref_id = self.intern_sha1(loc_sha1)
+            self._queue_token_index(pipe, location_tokens, ref_id, loc_hll.P)
+
+            dataset_hll = HllSet()
+            n_tokens = 0
+            tokens = iter(dataset_tokens)
+            while True:
+                chunk = list(itertools.islice(tokens, chunk_size))
+                if not chunk:
+                    break
+                n_tokens += len(chunk)
+                dataset_hll.add_batch(chunk)
+                self._queue_token_index(pipe, chunk, ref_id, dataset_hll.P)
+                if len(pipe) >= flush_every:
+                    yield from flush()
+            if n_tokens == 0:
+                raise ValueError("Tokens cannot be empty")
+
+            dataset_sha1 = dataset_hll.id()
+            loc_key = f"b:{loc_sha1}"
+            dataset_key = f"b:{loc_sha1}:{dataset_sha1}"
+            self.store_hllset(pipe, loc_key, loc_hll)
+            self.store_hllset(pipe, dataset_key, dataset_hll)
+            done.append((loc_key, dataset_key))
+            if len(pipe) >= flush_every:
+                yield from flush()
+
+        if len(pipe) or done:
+            yield from flush()
+
+    def _queue_token_index(self, pipe, tokens: List[str], ref_id: int, P: int):
+        """Queue token index script calls for one chunk of tokens on pipe."""
+        for keys, args in _token_index_calls(tokens, ref_id, self.roaring_refs, P or 10, TOKEN_INDEX_CHUNK):
+            self._token_index_script(keys=keys, args=args, client=pipe)
+
     def _create_hll_with_index(self, tokens: List[str], ref_sha1: Optional[str] = None) -> Tuple[HllSet, str]:
         """
         Create HLL and update token index in one operation.
         
         Args:
             tokens: List of tokens to process
-            hll_type: Type of HLL ('location' or 'dataset')
-            ref_sha1: Optional reference SHA1 for datasets
+            ref_sha1: Optional reference SHA1 recorded in the token index
+                (datasets reference their location); defaults to the HLL's own SHA1
             
         Returns:
             Tuple of (HllSet, sha1_hash)
         """
         hll = HllSet()
-        for token in tokens:
-            hll.add(token)
+        hll.add_batch(tokens)
         
         hll_sha1 = hll.id()
         if ref_sha1 is None:
-            ref_sha1 = hll.sha1
+            ref_sha1 = hll_sha1
 
-        print(f"Created HLL with SHA1: {ref_sha1}")
+        print(f"Created HLL with SHA1: {hll_sha1}")
         # Update token index        
-        self._update_token_index_bulk(tokens, ref_sha1, 10)
+        self._update_token_index_bulk(tokens, ref_sha1, hll.P)
         
         return hll, hll_sha1
 
-    def _update_token_index_bulk(self, tokens: List[str], hll_sha1: str, P):
-        """Bulk update token index for better performance."""
+    def _update_token_index_bulk(self, tokens: List[str], hll_sha1: str, P, chunk_size: int = TOKEN_INDEX_CHUNK):
+        """
+        Bulk update token index.
+
+        Tokens are first aggregated locally (one hash and one TF increment by
+        the occurrence count per unique token). Each chunk of unique tokens
+        is then upserted by one call of the token index script (TF increment,
+        ref id added to the token's refs set/bitmap, hash/bin/zeros
+        set-if-absent), and all chunks go out in a single pipeline, so there
+        are no per-token round trips.
+        """
         if P is None:
             P = 10  # Fallback to default value if P is None
 
-        pipe = self.redis.pipeline()
-        
-        for token in tokens:
-            token_hash, _ = mmh3.hash64(token)
-            token_hash = token_hash & 0xFFFFFFFFFFFFFFFF  # Convert to unsigned 64-bit integer
-            token_key = f"meta:tokens:{token_hash:020}"
-            
-            # Prepare reference tags
-            ref_tags = []
-            
-            ref_tags.append(hll_sha1)
-            
-            # Update token metadata
-            pipe.hincrby(token_key, "TF", 1)
-            if ref_tags:
-                # Use hsetnx to set the 'refs' field only if it does not exist
-                existing_refs = self.redis.hget(token_key, "refs")
-                if existing_refs:
-                    updated_refs = ",".join(set(existing_refs.decode().split(",") + ref_tags))
-                    pipe.hset(token_key, "refs", updated_refs)
-                else:
-                    pipe.hset(token_key, "refs", ",".join(ref_tags))
-            
-            # Set other fields if not exists
-            pipe.hsetnx(token_key, "hash", f"{token_hash:020}")
-            pipe.hsetnx(token_key, "bin", token_hash >> (64 - P))  # Using P=10
-            pipe.hsetnx(token_key, "zeros", (token_hash & -token_hash).bit_length() - 1) if token_hash != 0 else 0
-        
+        ref_id = self.intern_sha1(hll_sha1)
+        pipe = self.redis.pipeline(transaction=False)
+        for keys, args in _token_index_calls(tokens, ref_id, self.roaring_refs, P, chunk_size):
+            self._token_index_script(keys=keys, args=args, client=pipe)
         pipe.execute()
 
+    # HLL id dictionary -------------------------------------------
+    # ==============================================================================
+
+    def intern_sha1(self, sha1: str) -> int:
+        """
+        Map an HLL SHA1 to its compact integer id, assigning the next id on
+        first sight. Ids never change, so they are cached in process.
+        """
+        hll_id = self._hll_ids.get(sha1)
+        if hll_id is None:
+            hll_id = int(self._intern_script(
+                keys=[HLL_IDS_KEY, HLL_SHA1S_KEY, HLL_IDS_COUNTER_KEY],
+                args=[sha1]
+            ))
+            self._hll_ids[sha1] = hll_id
+        return hll_id
+
+    def sha1s_for_ids(self, hll_ids: List[int]) -> List[Optional[str]]:
+        """Resolve interned integer ids back to HLL SHA1s."""
+        if not hll_ids:
+            return []
+        return [
+            sha1.decode() if sha1 is not None else None
+            for sha1 in self.redis.hmget(HLL_SHA1S_KEY, list(hll_ids))
+        ]
+
+    def token_refs(self, token: str) -> List[str]:
+        """
+        SHA1s of the HLLs referenced by a token, read from its refs
+        bitmap (or set) with a single lookup.
+        """
+        refs_key = f"meta:token_refs:{_token_hash(token):020}"
+        if self.roaring_refs:
+            hll_ids = self.redis.execute_command("R.GETINTARRAY", refs_key) or []
+        else:
+            hll_ids = sorted(int(i) for i in self.redis.smembers(refs_key))
+        return self.sha1s_for_ids(hll_ids)
+
     # Store and retrieve HLLs -------------------------------------------
     # ==============================================================================
     #   
-    def store_hllset(self, pipe, key: str, hll: HllSet):
+    def store_hllset(self, pipe, key: str, hll: HllSet, ex: Optional[int] = None):
         """
-        Store HLL counts in a Redis Roaring Bitmap.
+        Store an HllSet as a single encoded value (see meta_algebra.encode_hllset).
 
         Args:
-            pipe: Redis pipeline object.
-            key: Redis key to store the bitmap under.
-            hll: HllSet object containing the counts.
+            pipe: Redis pipeline (or client) to issue the SET on.
+            key: Redis key to store the HllSet under.
+            hll: HllSet object to store.
+            ex: Optional expiry in seconds.
         """
-        # Flatten the HLL counts into a binary vector
-        counts = hll.counts.flatten()
-
-        # Set bits in the Roaring Bitmap
-        for index, value in enumerate(counts):
-            if value:  # Only set bits for non-zero values
-                pipe.execute_command("SETBIT", key, index, 1)
+        pipe.set(key, encode_hllset(hll), ex=ex)
 
     def retrieve_hllset(self, key: str, P: int = 10) -> HllSet:
         """
-        Retrieve an HllSet from Redis.
+        Retrieve an HllSet from Redis with a single GET.
 
         Args:
             key: Redis key to retrieve.
-            P: Precision for the new HllSet (default 10).
+            P: Precision of pre-codec values stored without a header;
+               encoded values carry their own.
 
         Returns:
             HllSet: The reconstructed HllSet object, or None if the key doesn't exist.
         """
         try:
-            # Fetch the serialized HLL counts from Redis
             byte_array = self.redis.get(key)
             if byte_array is None:
                 return None  # Key does not exist in Redis
 
-            # Deserialize the byte array into a numpy array
-            counts = np.frombuffer(byte_array, dtype=np.uint32)
-
-            # Reconstruct the HllSet object
-            hllset = HllSet(P)
-            hllset.counts = counts
-            return hllset
+            return decode_hllset(byte_array, P)
         except Exception as e:
             raise ValueError(f"Failed to retrieve HllSet: {str(e)}")
         
@@ -269,61 +782,123 @@ class RedisStore:
         edge_data, edge_sha1 = self._prepare_edge_data(
             loc_sha1, dataset_sha1, label, metadata or {}
         )
-        
-        commit_id = str(uuid.uuid1())
-        timestamp = int(time.time() * 1000)
+        dataset_value = self.redis.get(dataset_key)
         
         try:
             with self.redis.pipeline() as pipe:
-                # 1. Archive existing edges
-                self._archive_existing_edges(pipe, loc_sha1)
-                
-                # 2. Create new edge
-                edge_key = f"edge:head:{commit_id}:{edge_sha1}"
-                edge_data["timestamp"] = timestamp
-                pipe.hset(edge_key, mapping=edge_data)
-                
-                # 3. Promote to persistent storage
-                new_loc_key = f"rbs:{loc_sha1}"
-                new_dataset_key = f"rbs:{loc_sha1}:{dataset_sha1}"
-                pipe.rename(location_key, new_loc_key)
-                pipe.rename(dataset_key, new_dataset_key)
-                
-                # 4. Record commit
-                pipe.hset(f"meta:commits:{commit_id}", mapping={
-                    "timestamp": timestamp,
-                    "edge_key": edge_key
-                })
-                
+                result = self._queue_commit(pipe, location_key, dataset_key, edge_data, edge_sha1,
+                                            dataset_value=dataset_value)
                 pipe.execute()
-                
-                return {
-                    "status": "success",
-                    "commit_id": commit_id,
-                    "edge_key": edge_key,
-                    "location_key": new_loc_key,
-                    "dataset_key": new_dataset_key
-                }
+                return result
                 
         except Exception as e:
             raise RuntimeError(f"Commit failed: {str(e)}") from e
 
+    def _queue_commit(self, pipe, location_key: str, dataset_key: str, edge_data: dict,
+                      edge_sha1: str, promote_location: bool = True,
+                      dataset_value: Optional[bytes] = None) -> Dict:
+        """
+        Queue the writes of one commit on a transaction pipeline, see
+        _queue_commit_writes.
+
+        Returns:
+            Commit result, valid once the pipeline has executed
+        """
+        commit_id, edge_key = _new_commit(edge_sha1)
+        # 1. Archive existing edges, the new edge becomes the head
+        self._archive_existing_edges(pipe, location_key[2:], edge_key)
+        return _queue_commit_writes(pipe, commit_id, edge_key, location_key, dataset_key,
+                                    edge_data, promote_location, dataset_value)
+
+    def commit_many(self, commits: Iterable[Union[Tuple, Dict]], retries: int = 3,
+                    edges: Optional[List[Tuple[dict, str]]] = None) -> List[Dict]:
+        """
+        Group commit: validate and apply many commits in one MULTI/EXEC.
+
+        The buffer keys are WATCHed and checked with one pipelined EXISTS
+        round trip; if any of them changes before EXEC the whole group is
+        re-validated and retried. Commits sharing a location promote it once.
+
+        Args:
+            commits: (location_key, dataset_key[, label[, metadata]]) tuples
+                or dicts with those keys, as taken by commit()
+            retries: Attempts when a watched key changes concurrently
+            edges: (edge_data, edge_sha1) per commit, from _prepare_edge_data;
+                computed here when omitted
+
+        Returns:
+            One result per commit, in order: the commit() result, or
+            {"status": "error", "message": ...} for commits that were rejected
+        """
+        entries = [_commit_args(c) for c in commits]
+        results = [None] * len(entries)
+        edges = edges or [None] * len(entries)
+
+        # Namespace and duplicate checks need no round trip
+        seen_datasets = set()
+        for i, (location_key, dataset_key, _, _) in enumerate(entries):
+            if not location_key.startswith("b:") or not dataset_key.startswith("b:"):
+                results[i] = _commit_error(location_key, dataset_key, "Key not in buffer namespace")
+            elif dataset_key in seen_datasets:
+                results[i] = _commit_error(location_key, dataset_key, "Dataset committed twice in one group")
+            seen_datasets.add(dataset_key)
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        keys = list(dict.fromkeys(k for i in pending for k in entries[i][:2]))
+        for attempt in range(retries):
+            try:
+                with self.redis.pipeline() as pipe:
+                    pipe.watch(*keys)
+                    reads = self.redis.pipeline(transaction=False)
+                    for key in keys:
+                        reads.exists(key)
+                    dataset_keys = [entries[i][1] for i in pending]
+                    reads.mget(dataset_keys)
+                    *found, dataset_values = reads.execute()
+                    existing = {key for key, exists in zip(keys, found) if exists}
+                    dataset_values = dict(zip(dataset_keys, dataset_values))
+
+                    pipe.multi()
+                    promoted = set()
+                    queued = []
+                    for i in pending:
+                        location_key, dataset_key, label, metadata = entries[i]
+                        missing = [k for k in (location_key, dataset_key) if k not in existing]
+                        if missing:
+                            results[i] = _commit_error(location_key, dataset_key, f"Key {missing[0]} does not exist")
+                            continue
+                        edge_data, edge_sha1 = edges[i] or self._prepare_edge_data(
+                            location_key[2:], dataset_key.split(":")[-1], label, metadata or {}
+                        )
+                        start = len(pipe)
+                        result = self._queue_commit(pipe, location_key, dataset_key, edge_data, edge_sha1,
+                                                    promote_location=location_key not in promoted,
+                                                    dataset_value=dataset_values[dataset_key])
+                        promoted.add(location_key)
+                        queued.append((i, result, start, len(pipe)))
+
+                    replies = pipe.execute(raise_on_error=False) if queued else []
+                    for i, result, start, end in queued:
+                        errors = [r for r in replies[start:end] if isinstance(r, Exception)]
+                        results[i] = result if not errors else _commit_error(*entries[i][:2], str(errors[0]))
+                    return results
+            except redis.exceptions.WatchError:
+                continue
+
+        for i in pending:
+            results[i] = _commit_error(*entries[i][:2], f"Commit conflict after {retries} attempts")
+        return results
+
+    def commit_queue(self, max_batch: int = 500, max_latency: float = 0.05) -> "CommitQueue":
+        """Background write-behind queue feeding commit_many, see CommitQueue."""
+        return CommitQueue(self, max_batch=max_batch, max_latency=max_latency)
+
     def _prepare_edge_data(self, loc_sha1: str, dataset_sha1: str,
                          label: str, metadata: dict) -> Tuple[dict, str]:
         """Prepare edge data dictionary and calculate content hash."""
-        attr = json.dumps(metadata or {})
-        edge_data = {
-            "label": label,
-            "left": loc_sha1,
-            "right": dataset_sha1,
-            "attr": attr
-        }
-
-        hll = HllSet()
-        hll.from_dict(edge_data)
-        edge_sha1 = hll.id()
-
-        return edge_data, edge_sha1
+        return _edge_data(loc_sha1, dataset_sha1, label, metadata)
 
     def _validate_buffer_keys(self, *keys):
         """Validate keys are in buffer namespace and exist."""
@@ -333,19 +908,48 @@ class RedisStore:
             if not self.redis.exists(key):
                 raise ValueError(f"Key {key} does not exist")
 
-    def _archive_existing_edges(self, pipe, loc_sha1: str):
-        """Move any existing edges for this location to tail."""
-        for doc in self.redis.ft("edge:head").search(f"@left:{loc_sha1}").docs:
-            old_key = doc.id
-            new_key = old_key.replace("edge:head:", "edge:tail:", 1)
-            pipe.rename(old_key, new_key)
+    def _archive_existing_edges(self, pipe, loc_sha1: str, edge_key: str):
+        """
+        Move any existing edges for this location to tail and record
+        edge_key as its head.
+
+        The location's head edges are kept in meta:heads:<loc_sha1>, so this
+        is a single script call queued on the commit transaction rather
+        than a Redisearch query ahead of it.
+        """
+        self._archive_heads_script(keys=[f"{HEADS_KEY_PREFIX}{loc_sha1}"], args=[edge_key], client=pipe)
+
+    def rebuild_heads(self, batch: int = 1000) -> int:
+        """
+        Rebuild the per-location head sets from the edge:head: hashes, for
+        edges committed before the head sets existed. Runs on schema
+        upgrade; scans keys rather than the edge:head index, which may
+        still be re-indexing then.
+
+        Returns:
+            Number of head edges recorded
+        """
+        heads = {}
+        for keys in itertools.batched(self.redis.scan_iter(match="edge:head:*", count=batch), batch):
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hget(key, "left")
+            for key, left in zip(keys, pipe.execute()):
+                if left is not None:
+                    heads.setdefault(left.decode(), []).append(key.decode())
+        pipe = self.redis.pipeline()
+        for loc_sha1, edge_keys in heads.items():
+            pipe.delete(f"{HEADS_KEY_PREFIX}{loc_sha1}")
+            pipe.sadd(f"{HEADS_KEY_PREFIX}{loc_sha1}", *edge_keys)
+        pipe.execute()
+        return sum(len(edge_keys) for edge_keys in heads.values())
 
     def _store_hll_with_retry(self, pipe, key: str, hll: HllSet, retries: int = 3):
         """Store HLL with retry logic for transient failures."""
         attempts = 0
         while attempts < retries:
             try:
-                pipe.set(key, hll.counts.tobytes(), ex=86400)
+                self.store_hllset(pipe, key, hll, ex=86400)
                 return
             except Exception:
                 attempts += 1
@@ -398,45 +1002,494 @@ class RedisStore:
                 "type": type(e).__name__
             }
     
+    # Similarity search ------------------------------------------------
+    # ==============================================================================
+
+    def similar(self, key_or_hll: Union[str, HllSet], k: int = 10,
+                shortlist: Optional[int] = None) -> List[Dict]:
+        """
+        Committed datasets most similar to a stored key or an HllSet.
+
+        Candidates come from the LSH buckets the query's signature falls
+        in, so the cost depends on the bucket sizes rather than on the
+        number of stored sets. They are ranked by signature agreement and
+        only the best shortlist is fetched and rescored exactly.
+
+        Args:
+            key_or_hll: Redis key of a stored HllSet, or an HllSet
+            k: Number of results
+            shortlist: Candidates rescored exactly (default 4 * k)
+
+        Returns:
+            Up to k {"key", "jaccard"} dicts, by descending Jaccard
+        """
+        query_key = None
+        if isinstance(key_or_hll, str):
+            query_key = key_or_hll
+            encoded = self.redis.get(query_key)
+            if encoded is None:
+                raise ValueError(f"Key {query_key} does not exist")
+            counts = decode_registers(encoded)
+        else:
+            counts = np.asarray(key_or_hll.counts, dtype=np.uint32)
+
+        signature = register_signature(counts, LSH_BANDS * LSH_ROWS)
+        if signature is None:
+            return []
+        candidates = [
+            key.decode() for key in self.redis.sunion(_lsh_buckets(signature, counts.size.bit_length() - 1))
+        ]
+        candidates = [key for key in candidates if key != query_key]
+        if not candidates:
+            return []
+
+        # Rank by the fraction of equal signature entries
+        estimates = np.array([
+            np.mean(np.frombuffer(sig, dtype="<u4") == signature) if sig else 0.0
+            for sig in self.redis.hmget(LSH_SIGNATURES_KEY, candidates)
+        ])
+        best = np.argsort(-estimates, kind="stable")[:shortlist or 4 * k]
+        keys = [candidates[i] for i in best]
+        found = [(key, value) for key, value in zip(keys, self.redis.mget(keys)) if value is not None]
+        if not found:
+            return []
+
+        registers = np.stack([decode_registers(value) for _, value in found])
+        scores = similarity_matrix(counts[None, :], registers, workers=1)[0]
+        return [
+            {"key": found[i][0], "jaccard": float(scores[i])}
+            for i in np.argsort(-scores, kind="stable")[:k]
+        ]
+
+    def rebuild_similarity_index(self, match: str = "rbs:*:*", batch: int = 1000, P: int = 10) -> int:
+        """
+        Add stored dataset HllSets to the LSH index, for datasets committed
+        before the index existed. P is the precision of pre-codec values
+        stored without a header.
+
+        Returns:
+            Number of keys scanned
+        """
+        scanned = 0
+        for keys in itertools.batched(self.redis.scan_iter(match=match, count=batch), batch):
+            keys = [key.decode() for key in keys]
+            pipe = self.redis.pipeline(transaction=False)
+            for key, value in zip(keys, self.redis.mget(keys)):
+                if value is not None:
+                    _queue_similarity_index(pipe, key, value, P)
+            pipe.execute()
+            scanned += len(keys)
+        return scanned
+
     # Set operations ------------------------------------------------
     # ==============================================================================
     
-    def set_operation(self, operation: str, keys: list, result_key: str, **kwargs):
+    def set_operation(self, operation: str, keys: list, result_key: Optional[str] = None,
+                      ex: Optional[int] = None, P: int = 10) -> Dict:
         """
-        Perform set operations on HllSets stored in Redis.
-        
+        Perform a set operation over any number of HllSets stored in Redis.
+
+        The registers are combined server-side by one script call (BITOP for
+        dense sets of equal precision), so only the result crosses the
+        network.
+
         Args:
-            operation: One of ['union', 'intersection', 'difference']
-            keys: List of source keys (2 required)
-            result_key: Key to store result under
-            kwargs: Additional storage options
+            operation: One of ['union', 'intersection', 'difference'];
+                difference is the first set minus the union of the others
+            keys: Source keys (one or more)
+            result_key: Key to store the result under; when omitted only
+                the estimated cardinality is returned
+            ex: Optional expiry of result_key in seconds
+            P: Precision of pre-codec values stored without a header;
+               encoded values carry their own
+
+        Returns:
+            Dictionary with status, result_key and the result's count
         """
-        if len(keys) != 2:
-            raise ValueError("Exactly 2 keys required for set operations")
-            
-        ops = {
-            'union': lambda a, b: a.union(b),
-            'intersection': lambda a, b: a.intersection(b),
-            'difference': lambda a, b: a.diff(b)
-        }
-        
-        if operation not in ops:
-            raise ValueError(f"Invalid operation. Must be one of {list(ops.keys())}")
-            
-        hll1 = self.retrieve_hllset(keys[0])
-        hll2 = self.retrieve_hllset(keys[1])
-        
-        if hll1 is None or hll2 is None:
-            raise ValueError("One or both HllSets not found")
-            
-        result = ops[operation](hll1, hll2)
-        return self.store_hllset(result_key, result, **kwargs)
+        script_keys, args = _set_operation_call(operation, keys, result_key, ex, P)
+        try:
+            encoded = self._set_operation_script(keys=script_keys, args=args)
+        except redis.exceptions.ResponseError as e:
+            raise ValueError(f"Set operation failed: {str(e)}") from e
+        return _set_operation_result(result_key, encoded)
+
+# Group commit ------------------------------------------------------------
+# ==============================================================================
+
+class CommitQueue:
+    """
+    Write-behind queue in front of RedisStore.commit_many.
+
+    submit() returns a Future at once. A background thread gathers
+    submitted commits until max_batch are waiting or the oldest has waited
+    max_latency seconds, then applies them with one commit_many call and
+    resolves each Future with its commit result.
+
+    The edge hash builds an HllSet, which may be a JuliaHllSet, so submit()
+    computes it on the caller's thread; the background thread only talks
+    to Redis.
+    """
+
+    def __init__(self, store: "RedisStore", max_batch: int = 500, max_latency: float = 0.05):
+        """
+        Args:
+            store: RedisStore to commit to
+            max_batch: Most commits applied per group
+            max_latency: Longest a submitted commit waits for its group, in seconds
+        """
+        if max_batch < 1:
+            raise ValueError("max_batch must be positive")
+        self.store = store
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="commit-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, location_key: str, dataset_key: str,
+               label: str = "id", metadata: Optional[Dict] = None) -> Future:
+        """Queue a commit; the Future resolves to its commit_many result."""
+        future = Future()
+        edge = self.store._prepare_edge_data(
+            location_key[2:], dataset_key.split(":")[-1], label, metadata or {}
+        )
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("CommitQueue is closed")
+            self._queue.put(((location_key, dataset_key, label, metadata), edge, future))
+        return future
+
+    def close(self, timeout: Optional[float] = None):
+        """Apply the commits still queued and stop the background thread."""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            results = self.store.commit_many([commit for commit, _, _ in batch],
+                                             edges=[edge for _, edge, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+# Async store ------------------------------------------------------------
+# ==============================================================================
+
+# One redis.asyncio connection pool per (host, port, db), shared by every
+# AsyncRedisStore in the process
+_async_pools: Dict[Tuple[str, int, int], redis.asyncio.ConnectionPool] = {}
+
+
+def _async_pool(host: str, port: int, db: int) -> redis.asyncio.ConnectionPool:
+    """Return the process-wide async connection pool for a Redis server."""
+    pool = _async_pools.get((host, port, db))
+    if pool is None:
+        pool = redis.asyncio.ConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            socket_connect_timeout=5,
+            socket_keepalive=True,
+            decode_responses=False
+        )
+        _async_pools[(host, port, db)] = pool
+    return pool
+
+
+class AsyncRedisStore:
+    """
+    RedisStore counterpart on redis.asyncio, for use from async handlers.
+
+    Connections come from a process-wide pool, so constructing a store is
+    cheap. Redisearch indices are not created on construction; await
+    initialize_indices() once if they may be missing.
+    """
+
+    def __init__(self, host='redis', port=6379, db=0, roaring_refs=True):
+        """
+        Args:
+            host: Redis host (default 'redis')
+            port: Redis port (default 6379)
+            db: Redis database number (default 0)
+            roaring_refs: Keep token refs in roaring bitmaps (needs the
+                redis-roaring module) instead of Redis sets
+        """
+        self.roaring_refs = roaring_refs
+        self._hll_ids = {}
+        self._server = (host, port, db)
+        self.redis = redis.asyncio.Redis(connection_pool=_async_pool(host, port, db))
+        self._token_index_script = self.redis.register_script(TOKEN_INDEX_LUA)
+        self._intern_script = self.redis.register_script(INTERN_LUA)
+        self._archive_heads_script = self.redis.register_script(ARCHIVE_HEADS_LUA)
+        self._set_operation_script = self.redis.register_script(SET_OPERATION_LUA)
+
+    async def initialize_indices(self):
+        """
+        Initialize all Redisearch indices, at most once per server per
+        process, see RedisStore._initialize_indices.
+        """
+        if self._server in _schema_ready:
+            return
+        try:
+            stored = await self.redis.get(SCHEMA_VERSION_KEY)
+            if stored is None or int(stored) < SCHEMA_VERSION:
+                for name, fields, prefixes in _index_schemas():
+                    try:
+                        await self.redis.ft(name).dropindex(delete_documents=False)
+                    except redis.exceptions.ResponseError as e:
+                        if "unknown index" not in str(e).lower():
+                            raise
+                    try:
+                        await self.redis.ft(name).create_index(fields, definition=IndexDefinition(prefix=prefixes))
+                    except redis.exceptions.ResponseError as e:
+                        if "Index already exists" not in str(e):
+                            raise
+                await self.rebuild_heads()
+                await self.redis.set(SCHEMA_VERSION_KEY, SCHEMA_VERSION)
+            _schema_ready.add(self._server)
+        except redis.exceptions.ResponseError as e:
+            print(f"Error creating indices: {e}")
+        except redis.exceptions.RedisError as e:
+            print(f"Redis error during initialization: {e}")
+
+    # Data ingestion and processing -------------------------------------------
+
+    async def ingest(self, location_tokens: List[str], dataset_tokens: List[str]) -> Tuple[str, str]:
+        """
+        Ingest a location/dataset pair into the buffer namespace.
+
+        Returns:
+            Tuple of (location_key, dataset_key)
+        """
+        if not location_tokens or not dataset_tokens:
+            raise ValueError("Tokens cannot be empty")
+
+        loc_hll, loc_sha1 = await self._create_hll_with_index(location_tokens)
+        dataset_hll, dataset_sha1 = await self._create_hll_with_index(dataset_tokens, ref_sha1=loc_sha1)
+
+        loc_key = f"b:{loc_sha1}"
+        dataset_key = f"b:{loc_sha1}:{dataset_sha1}"
+
+        pipe = self.redis.pipeline()
+        await self.store_hllset(pipe, loc_key, loc_hll)
+        await self.store_hllset(pipe, dataset_key, dataset_hll)
+        await pipe.execute()
+
+        return loc_key, dataset_key
+
+    async def _create_hll_with_index(self, tokens: List[str], ref_sha1: Optional[str] = None) -> Tuple[HllSet, str]:
+        """Create HLL and update token index, see RedisStore._create_hll_with_index."""
+        hll = HllSet()
+        hll.add_batch(tokens)
+
+        hll_sha1 = hll.id()
+        if ref_sha1 is None:
+            ref_sha1 = hll_sha1
+
+        await self._update_token_index_bulk(tokens, ref_sha1, hll.P)
+
+        return hll, hll_sha1
+
+    async def _update_token_index_bulk(self, tokens: List[str], hll_sha1: str, P, chunk_size: int = TOKEN_INDEX_CHUNK):
+        """Bulk update token index, see RedisStore._update_token_index_bulk."""
+        ref_id = await self.intern_sha1(hll_sha1)
+        pipe = self.redis.pipeline(transaction=False)
+        for keys, args in _token_index_calls(tokens, ref_id, self.roaring_refs, P or 10, chunk_size):
+            await self._token_index_script(keys=keys, args=args, client=pipe)
+        await pipe.execute()
+
+    async def intern_sha1(self, sha1: str) -> int:
+        """Map an HLL SHA1 to its compact integer id, see RedisStore.intern_sha1."""
+        hll_id = self._hll_ids.get(sha1)
+        if hll_id is None:
+            hll_id = int(await self._intern_script(
+                keys=[HLL_IDS_KEY, HLL_SHA1S_KEY, HLL_IDS_COUNTER_KEY],
+                args=[sha1]
+            ))
+            self._hll_ids[sha1] = hll_id
+        return hll_id
+
+    # Store and retrieve HLLs -------------------------------------------
+
+    async def store_hllset(self, pipe, key: str, hll: HllSet, ex: Optional[int] = None):
+        """Store an HllSet as a single encoded value on a pipeline or client."""
+        await pipe.set(key, encode_hllset(hll), ex=ex)
+
+    async def retrieve_hllset(self, key: str, P: int = 10) -> HllSet:
+        """
+        Retrieve an HllSet from Redis with a single GET, or None if the key
+        doesn't exist.
+        """
+        try:
+            byte_array = await self.redis.get(key)
+            if byte_array is None:
+                return None
+
+            return decode_hllset(byte_array, P)
+        except Exception as e:
+            raise ValueError(f"Failed to retrieve HllSet: {str(e)}")
+
+    async def commit(self, location_key: str, dataset_key: str,
+                     label: str = "id", metadata: Optional[Dict] = None) -> Dict:
+        """
+        Promote a buffered location/dataset pair, see RedisStore.commit.
+        """
+        await self._validate_buffer_keys(location_key, dataset_key)
+
+        loc_sha1 = location_key[2:]
+        dataset_sha1 = dataset_key.split(":")[-1]
+
+        edge_data, edge_sha1 = _edge_data(loc_sha1, dataset_sha1, label, metadata or {})
+        dataset_value = await self.redis.get(dataset_key)
+
+        try:
+            async with self.redis.pipeline() as pipe:
+                commit_id, edge_key = _new_commit(edge_sha1)
+                await self._archive_existing_edges(pipe, loc_sha1, edge_key)
+                result = _queue_commit_writes(pipe, commit_id, edge_key, location_key, dataset_key,
+                                              edge_data, dataset_value=dataset_value)
+                await pipe.execute()
+                return result
+
+        except Exception as e:
+            raise RuntimeError(f"Commit failed: {str(e)}") from e
+
+    async def _validate_buffer_keys(self, *keys):
+        """Validate keys are in buffer namespace and exist."""
+        for key in keys:
+            if not key.startswith("b:"):
+                raise ValueError(f"Key {key} not in buffer namespace")
+        exists = await self.redis.exists(*keys)
+        if exists != len(keys):
+            raise ValueError(f"Keys {list(keys)} do not all exist")
+
+    async def _archive_existing_edges(self, pipe, loc_sha1: str, edge_key: str):
+        """
+        Move any existing edges for this location to tail and record
+        edge_key as its head, see RedisStore._archive_existing_edges.
+        """
+        await self._archive_heads_script(keys=[f"{HEADS_KEY_PREFIX}{loc_sha1}"], args=[edge_key], client=pipe)
+
+    async def rebuild_heads(self, batch: int = 1000) -> int:
+        """
+        Rebuild the per-location head sets, see RedisStore.rebuild_heads.
+        """
+        heads = {}
+        keys = [key async for key in self.redis.scan_iter(match="edge:head:*", count=batch)]
+        for chunk in itertools.batched(keys, batch):
+            pipe = self.redis.pipeline(transaction=False)
+            for key in chunk:
+                pipe.hget(key, "left")
+            for key, left in zip(chunk, await pipe.execute()):
+                if left is not None:
+                    heads.setdefault(left.decode(), []).append(key.decode())
+        pipe = self.redis.pipeline()
+        for loc_sha1, edge_keys in heads.items():
+            pipe.delete(f"{HEADS_KEY_PREFIX}{loc_sha1}")
+            pipe.sadd(f"{HEADS_KEY_PREFIX}{loc_sha1}", *edge_keys)
+        await pipe.execute()
+        return sum(len(edge_keys) for edge_keys in heads.values())
+
+    # Redis native commands -------------------------------------------
+
+
+    async def ping(self, **kwargs):
+        """
+        Test Redis connection with a write/read cycle, see RedisStore.ping.
+        """
+        try:
+            test_key = kwargs.get('test_key', 'sgs:ping_test')
+            test_value = kwargs.get('test_value', b'pong')
+
+            await self.redis.set(test_key, test_value)
+            retrieved = await self.redis.get(test_key)
+
+            return {
+                "status": "success",
+                "response": retrieved == test_value,
+                "latency": await self.redis.latency_latest()
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": str(e),
+                "type": type(e).__name__
+            }
+
+    # Set operations ------------------------------------------------
+
+    async def set_operation(self, operation: str, keys: list, result_key: Optional[str] = None,
+                            ex: Optional[int] = None, P: int = 10) -> Dict:
+        """
+        Perform a set operation over any number of stored HllSets
+        server-side, see RedisStore.set_operation.
+        """
+        script_keys, args = _set_operation_call(operation, keys, result_key, ex, P)
+        try:
+            encoded = await self._set_operation_script(keys=script_keys, args=args)
+        except redis.exceptions.ResponseError as e:
+            raise ValueError(f"Set operation failed: {str(e)}") from e
+        return _set_operation_result(result_key, encoded)
+
+
+# Long-lived stores ------------------------------------------------------
+# ==============================================================================
+
+# RedisStore instances behind "meta_redis.RedisStore.<method>" processors
+# are kept by the Controller's instance cache; only the module-level
+# coroutine processors need this one
+_async_stores: Dict[tuple, AsyncRedisStore] = {}
+
+
+def get_async_store(host='redis', port=6379, db=0, roaring_refs=True) -> AsyncRedisStore:
+    """Process-wide AsyncRedisStore for a given configuration."""
+    key = (host, port, db, roaring_refs)
+    store = _async_stores.get(key)
+    if store is None:
+        store = _async_stores[key] = AsyncRedisStore(host, port, db, roaring_refs)
+    return store
+
 
 # Standalone function for compatibility
-def ping_redis(**kwargs):
+async def ping_redis(**kwargs):
     """
     Standalone function to ping Redis.
-    Compatible with dynamic calling system.
+    Compatible with dynamic calling system, which awaits coroutine results.
     """
-    store = RedisStore()
-    return store.ping(**kwargs)
\ No newline at end of file
+    return await get_async_store().ping(**kwargs)
\ No newline at end of file
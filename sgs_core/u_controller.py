@@ -1,9 +1,39 @@
+import collections
 import importlib.util
+import inspect
+import json
 import sys
+import threading
 import yaml
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Union
+
+# Long-lived instances kept per (class, params) for module.class.method processors
+INSTANCE_CACHE_SIZE = 64
+
+# libyaml-backed loader when PyYAML was built with it, pure Python otherwise
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def msgpack_loads(body: bytes) -> Any:
+    """Decode a msgpack body; msgpack is an optional dependency."""
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError("msgpack bodies require the 'msgpack' package")
+    try:
+        return msgpack.unpackb(body, raw=False)
+    except Exception as e:
+        raise ValueError(f"Invalid msgpack: {str(e)}")
+
 
 class Controller:
+
+    def __init__(self):
+        # processor -> resolved function, or (class, method name) for module.class.method
+        self._dispatch = {}
+        # (class, canonical params JSON) -> instance, least recently used first
+        self._instances = collections.OrderedDict()
+        self._instances_lock = threading.Lock()
     
     def yaml_to_dict(self, yaml_str: str) -> Dict[str, Any]:
         """
@@ -14,48 +44,108 @@ class Controller:
             Dictionary representation of YAML
         """
         try:
-            return yaml.safe_load(yaml_str) or {}
+            return yaml.load(yaml_str, Loader=YamlLoader) or {}
         except yaml.YAMLError as e:
             raise ValueError(f"Invalid YAML: {str(e)}")
 
+    def parse_request(self, body: Union[bytes, str], content_type: str = "") -> Dict[str, Any]:
+        """
+        Parse a request body by its content type:
+        application/json, application/msgpack, anything else as YAML.
+        Args:
+            body: Raw request body
+            content_type: Content-Type header of the request
+        Returns:
+            Request dictionary
+        """
+        content_type = content_type.lower()
+        if "msgpack" in content_type:
+            request = msgpack_loads(body)
+        elif "json" in content_type:
+            try:
+                request = json.loads(body)
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON: {str(e)}")
+        else:
+            request = self.yaml_to_dict(body)
+        if request is None:
+            return {}
+        if not isinstance(request, dict):
+            raise ValueError("Request body must be a mapping")
+        return request
+
+    def _resolve(self, module_name: str, function_name: str) -> Any:
+        """
+        Resolve a processor to its callable once; later requests for the
+        same processor are a dictionary lookup.
+        """
+        key = f"{module_name}.{function_name}"
+        target = self._dispatch.get(key)
+        if target is None:
+            module = importlib.import_module(module_name)
+            if '.' in function_name:
+                class_name, method_name = function_name.rsplit('.', 1)
+                target = (getattr(module, class_name), method_name)
+            else:
+                target = getattr(module, function_name)
+                if not callable(target):
+                    raise AttributeError(f"'{function_name}' is not callable")
+            self._dispatch[key] = target
+        return target
+
+    def _instance(self, class_obj: type, params: Dict[str, Any]) -> Any:
+        """Return the cached instance of class_obj for params, creating it on a miss.
+
+        The canonical JSON of params is only the cache key; the instance is
+        built from the original params so constructors see the real values.
+        """
+        # Canonical JSON makes the params hashable for the instance cache
+        key = (class_obj, json.dumps(params, sort_keys=True, default=str))
+        with self._instances_lock:
+            instance = self._instances.get(key)
+            if instance is not None:
+                self._instances.move_to_end(key)
+                return instance
+        instance = class_obj(**params) if params else class_obj()
+        with self._instances_lock:
+            # A concurrent miss may have stored one first; keep that one
+            instance = self._instances.setdefault(key, instance)
+            self._instances.move_to_end(key)
+            while len(self._instances) > INSTANCE_CACHE_SIZE:
+                self._instances.popitem(last=False)
+        return instance
+
     def run_function(self, 
         module_name: str,
         function_name: str,
-        yaml_params: str = None
+        params: Optional[Union[Dict[str, Any], str]] = None
     ) -> Any:
         """
         Enhanced function runner that handles:
         - Standalone functions
         - Class methods
         - Class instantiation
+
+        params is a dictionary of keyword arguments; a YAML string is
+        still accepted and parsed.
         """
         try:
-            # Import the module
-            module = importlib.import_module(module_name)
-            
+            if isinstance(params, str):
+                params = self.yaml_to_dict(params)
+            target = self._resolve(module_name, function_name)
+
             # Handle class.method syntax
-            if '.' in function_name:
-                class_name, method_name = function_name.rsplit('.', 1)
-                class_obj = getattr(module, class_name)
+            if isinstance(target, tuple):
+                class_obj, method_name = target
                 
                 # Check if we're calling a static method
-                if isinstance(class_obj, type):  # It's a class
-                    if yaml_params:
-                        params = self.yaml_to_dict(yaml_params)
-                        instance = class_obj(**params) if params else class_obj()
-                        return getattr(instance, method_name)()
-                    else:
-                        return getattr(class_obj, method_name)()
-                else:  # It's a nested object
-                    return getattr(class_obj, method_name)()
+                if isinstance(class_obj, type) and params:  # It's a class
+                    instance = self._instance(class_obj, params)
+                    return getattr(instance, method_name)()
+                # Static method or nested object
+                return getattr(class_obj, method_name)()
             else:
-                func = getattr(module, function_name)
-                if not callable(func):
-                    raise AttributeError(f"'{function_name}' is not callable")
-                
-                # Convert YAML if provided
-                params = self.yaml_to_dict(yaml_params) if yaml_params else {}
-                return func(**params) if params else func()
+                return target(**params) if params else target()
             
         except ModuleNotFoundError:
             raise ImportError(f"Module '{module_name}' not found")
@@ -66,28 +156,31 @@ class Controller:
                 raise ValueError(f"Function {function_name} doesn't accept provided parameters") from e
             raise
     
-    def process_request(self, yaml_request: str) -> Any:
+    def process_request(self, request: Union[Dict[str, Any], str]) -> Any:
         """
-        Process a YAML request with format:
+        Process a request, either an already parsed dictionary or a YAML
+        string, with format:
         processor: "module.function" or "module.class.method"
         params: {key: value}  # Optional
         """
         try:
-            request = self.yaml_to_dict(yaml_request)
-            processor = request.pop("processor", None)
+            if isinstance(request, str):
+                request = self.yaml_to_dict(request)
+            elif not isinstance(request, dict):
+                raise ValueError("Request must be a mapping")
+            # Copy, the caller's dictionary stays untouched
+            params = dict(request)
+            processor = params.pop("processor", None)
             
             if not processor:
                 raise ValueError("YAML request must contain 'processor' field")
             
-            # Extract params if they exist
-            params_str = yaml.dump(request) if request else None
-            
             # Handle both module.function and module.class.method cases
             parts = processor.split('.')
             if len(parts) == 2:  # module.function
-                return self.run_function(parts[0], parts[1], params_str)
+                return self.run_function(parts[0], parts[1], params)
             elif len(parts) == 3:  # module.class.method
-                return self.run_function(parts[0], f"{parts[1]}.{parts[2]}", params_str)
+                return self.run_function(parts[0], f"{parts[1]}.{parts[2]}", params)
             else:
                 raise ValueError("Processor must be in format 'module.function' or 'module.class.method'")
                 
@@ -96,4 +189,39 @@ class Controller:
                 "status": "error",
                 "message": str(e),
                 "type": type(e).__name__
-            }
\ No newline at end of file
+            }
+
+    def is_async_processor(self, processor: str) -> bool:
+        """
+        True if the processor resolves to a coroutine function, which has to
+        run on the event loop.
+        """
+        parts = processor.split('.')
+        if len(parts) not in (2, 3):
+            return False
+        try:
+            target = self._resolve(parts[0], '.'.join(parts[1:]))
+        except (ImportError, AttributeError):
+            return False
+        if isinstance(target, tuple):
+            class_obj, method_name = target
+            target = getattr(class_obj, method_name, None)
+        return inspect.iscoroutinefunction(target)
+
+    async def process_request_async(self, request: Union[Dict[str, Any], str]) -> Any:
+        """
+        Process a request like process_request, awaiting processors that are
+        coroutine functions (e.g. AsyncRedisStore-backed ones) so their I/O
+        overlaps with other requests on the event loop.
+        """
+        result = self.process_request(request)
+        if not inspect.isawaitable(result):
+            return result
+        try:
+            return await result
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": str(e),
+                "type": type(e).__name__
+            }
@@ -0,0 +1,249 @@
+import asyncio
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Tuple, Union
+
+from meta_algebra import hllsets_backend
+from u_controller import Controller
+
+# Execution modes for processors:
+#   inline  - run on the event loop (coroutine processors always run inline)
+#   thread  - bounded thread pool, for blocking I/O
+#   process - bounded process pool, for CPU-bound or Julia-heavy work
+EXECUTION_MODES = ("inline", "thread", "process")
+
+# Modules whose processors build JuliaHllSets. libjulia may only be entered
+# from the thread that started it, so with the Julia backend their sync
+# processors default to the process pool, whose workers run every request
+# on their own main thread. Never map them to "thread" in SGS_PROCESSOR_MODES
+# unless HLLSETS_BACKEND=numpy.
+JULIA_MODULES = ("meta_algebra", "meta_redis", "meta_hdf5")
+
+
+class Overloaded(Exception):
+    """Raised when the executor already has max_in_flight requests running."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Server overloaded, retry later")
+        self.retry_after = retry_after
+
+
+def parse_modes(spec: Optional[str]) -> Dict[str, str]:
+    """
+    Parse a processor mode spec such as
+    "meta_hdf5=process,meta_algebra.warm_up=inline".
+
+    Keys are full processor names or module names.
+    """
+    modes = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        processor, _, mode = item.partition("=")
+        mode = mode.strip()
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode '{mode}' for '{processor.strip()}'")
+        modes[processor.strip()] = mode
+    return modes
+
+
+# Controller of a process pool worker, created on first use in that worker
+_worker_controller = None
+
+
+def _run_in_worker(request: Dict[str, Any]) -> Any:
+    """Process a request inside a process pool worker."""
+    global _worker_controller
+    if _worker_controller is None:
+        _worker_controller = Controller()
+    return asyncio.run(_worker_controller.process_request_async(request))
+
+
+class Executor:
+    """
+    Runs Controller requests off the event loop.
+
+    Synchronous processors go to a thread pool by default (the process pool
+    for JULIA_MODULES under the Julia backend), or wherever modes says;
+    coroutine processors stay on the event loop. At
+    most max_in_flight requests run at once, beyond that run() raises
+    Overloaded instead of queuing. Batch requests wait for a slot instead,
+    and all batches together hold at most half of the slots so single
+    requests are not turned away by a large batch.
+    """
+
+    def __init__(self, controller: Controller, thread_workers: int = 16, process_workers: int = 4,
+                 max_in_flight: int = 64, modes: Optional[Dict[str, str]] = None,
+                 retry_after: int = 1):
+        """
+        Args:
+            controller: Controller that processes the requests
+            thread_workers: Size of the thread pool
+            process_workers: Size of the process pool (started on first use)
+            max_in_flight: Requests allowed to run concurrently
+            modes: Execution mode per processor or module name
+            retry_after: Seconds suggested to clients when overloaded
+        """
+        self.controller = controller
+        self.max_in_flight = max_in_flight
+        self.modes = modes or {}
+        self.retry_after = retry_after
+        self.process_workers = process_workers
+        self._threads = concurrent.futures.ThreadPoolExecutor(max_workers=thread_workers)
+        self._processes = None
+        self._in_flight = 0
+        # Futures of run(wait=True) callers, woken whenever a slot is freed
+        self._waiters = collections.deque()
+        # Bounds the slots taken by batch requests, created on the event loop
+        self._batch_slots = None
+
+    @classmethod
+    def from_env(cls, controller: Controller) -> "Executor":
+        """
+        Build an Executor from SGS_THREAD_WORKERS, SGS_PROCESS_WORKERS,
+        SGS_MAX_IN_FLIGHT, SGS_PROCESSOR_MODES and SGS_RETRY_AFTER.
+
+        SGS_PROCESSOR_MODES must keep JULIA_MODULES off "thread" while the
+        Julia backend is active: pool threads cannot call into libjulia.
+        """
+        return cls(
+            controller,
+            thread_workers=int(os.getenv("SGS_THREAD_WORKERS", "16")),
+            process_workers=int(os.getenv("SGS_PROCESS_WORKERS", "4")),
+            max_in_flight=int(os.getenv("SGS_MAX_IN_FLIGHT", "64")),
+            modes=parse_modes(os.getenv("SGS_PROCESSOR_MODES")),
+            retry_after=int(os.getenv("SGS_RETRY_AFTER", "1"))
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Requests currently running."""
+        return self._in_flight
+
+    def mode_for(self, processor: Optional[str]) -> str:
+        """Execution mode of a processor; malformed requests run inline."""
+        if not processor:
+            return "inline"
+        if self.controller.is_async_processor(processor):
+            return "inline"
+        module_name = processor.split(".", 1)[0]
+        default = "process" if hllsets_backend == "julia" and module_name in JULIA_MODULES else "thread"
+        return self.modes.get(processor, self.modes.get(module_name, default))
+
+    async def run(self, request: Union[Dict[str, Any], str], wait: bool = False) -> Any:
+        """
+        Process a request in the execution mode of its processor.
+
+        The request is a parsed dictionary; a YAML string is parsed here,
+        once, and the dictionary is handed on to the controller. With wait
+        the request waits for a free slot instead of being rejected.
+
+        Raises:
+            Overloaded: max_in_flight requests are already running.
+        """
+        while self._in_flight >= self.max_in_flight:
+            if not wait:
+                raise Overloaded(self.retry_after)
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+        self._in_flight += 1
+        release = True
+        try:
+            try:
+                if isinstance(request, str):
+                    request = self.controller.yaml_to_dict(request)
+                mode = self.mode_for(request.get("processor"))
+            except Exception:
+                # Let the controller report the malformed request
+                mode = "inline"
+
+            if mode == "inline":
+                return await self.controller.process_request_async(request)
+
+            if mode == "process":
+                future = self._process_pool().submit(_run_in_worker, request)
+            else:
+                future = self._threads.submit(self.controller.process_request, request)
+            # The slot is freed when the worker is done with the request, not
+            # when a cancelled caller stops waiting for it
+            release = False
+            loop = asyncio.get_running_loop()
+            future.add_done_callback(lambda _: self._release_soon(loop))
+            return await asyncio.wrap_future(future)
+        finally:
+            if release:
+                self._release()
+
+    def _release(self):
+        """Free an in-flight slot and wake the requests waiting for one."""
+        self._in_flight -= 1
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _release_soon(self, loop: asyncio.AbstractEventLoop):
+        """Free an in-flight slot from a worker's done callback."""
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # The loop is already closed, nothing is counting anymore
+            pass
+
+    async def run_batch(self, requests: Iterable[Union[Dict[str, Any], str]], parallelism: int = 8) -> AsyncIterator[Tuple[int, Any]]:
+        """
+        Run many requests concurrently, at most parallelism at a time, and
+        yield (index, result) pairs in completion order.
+
+        Batch requests wait for an in-flight slot rather than failing with
+        Overloaded. Across all batches at most half of max_in_flight (at
+        least one) run at once, the rest is left to single requests.
+        """
+        if parallelism < 1:
+            raise ValueError("parallelism must be positive")
+        if self._batch_slots is None:
+            self._batch_slots = asyncio.Semaphore(max(1, self.max_in_flight // 2))
+
+        async def run_one(index, request):
+            try:
+                async with self._batch_slots:
+                    return index, await self.run(request, wait=True)
+            except Exception as e:
+                return index, {"status": "error", "message": str(e), "type": type(e).__name__}
+
+        pending = set()
+        requests = enumerate(requests)
+        try:
+            while True:
+                for index, request in requests:
+                    pending.add(asyncio.ensure_future(run_one(index, request)))
+                    if len(pending) >= parallelism:
+                        break
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _process_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._processes is None:
+            # Spawned workers start clean instead of inheriting a forked
+            # (possibly Julia-initialized) interpreter
+            self._processes = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._processes
+
+    def shutdown(self):
+        """Stop the worker pools."""
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)